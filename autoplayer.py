@@ -0,0 +1,240 @@
+"""Play Tetris automatically.
+
+For each new Tetrimino, every placement reachable by rotating it then moving it
+sideways from where it spawned is tried, and the resulting playground is scored
+with a weighted sum of features (completed lines, holes, aggregate height and
+bumpiness, after Pierre Dellacherie's heuristics). The actions leading to the
+best placement are then applied.
+
+Playgrounds are searched on copies of the rows bitmasks of playground.Playground,
+so no Tetrimino nor Block object is involved. Run this module to play games
+without any window and measure the speed of the search:
+
+    python autoplayer.py --games 10 --seed 1
+"""
+from engine import Action
+import randomizers
+import tetriminos
+import argparse
+import settings
+import logging
+import helpers
+import engine
+import time
+
+# The autoplayer favors completed lines and punishes holes, high and bumpy playgrounds
+WEIGHTS = {
+    'lines': 0.760666,
+    'holes': -0.35663,
+    'aggregate_height': -0.510066,
+    'bumpiness': -0.184483
+}
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:
+    def popcount(value):
+        return bin(value).count('1')
+
+
+class Placement:
+    """The rows bitmasks of a rotation state of a Tetrimino, at column 0, along the lowest cell of each of its columns."""
+
+    def __init__(self, rotation, cells, width, height, bottoms):
+        self.rotation = rotation
+        self.cells = cells
+        self.width = width
+        self.height = height
+        self.masks = [0] * height
+        self.bottoms = bottoms
+
+        for x, y in cells:
+            self.masks[y] |= 1 << x
+
+
+# The placements of each rotation state of each Tetrimino class
+PLACEMENTS = {
+    getattr(tetriminos, name): [Placement(rotation, *state) for rotation, state in enumerate(getattr(tetriminos, name).rotations)]
+    for name in tetriminos.__all__
+}
+
+
+class Autoplayer:
+    """Find the best placement of the current Tetrimino of an engine."""
+
+    def __init__(self, weights=None):
+        self.weights = dict(WEIGHTS, **(weights or {}))
+        self.evaluations = 0
+
+    def get_actions(self, game_engine):
+        """Return the list of actions (rotations then moves) bringing the current Tetrimino to its best placement, or None if it can't be placed at all.
+
+        The Tetrimino then only has to fall."""
+        tetrimino = game_engine.current_tetrimino
+        playground = game_engine.playground
+        best = None
+
+        for rotations, x, y, placement in self._get_reachable_positions(tetrimino, playground):
+            score = self._evaluate(playground, placement, x, y)
+
+            if best is None or score > best[0]:
+                best = (score, rotations, x)
+
+        if best is None:
+            return None
+
+        score, rotations, x = best
+        start_x = self._get_rotated_x(tetrimino, playground, rotations)
+        move = Action.RIGHT if x > start_x else Action.LEFT
+
+        return [Action.ROTATE] * rotations + [move] * abs(x - start_x)
+
+    def _get_rotated_x(self, tetrimino, playground, rotations):
+        """Return the column of the given Tetrimino once rotated the given number of times (it's kept inside the playground)."""
+        x = tetrimino.x
+
+        for i in range(1, rotations + 1):
+            x = min(x, playground.cols - tetrimino.rotations[(tetrimino.rotation + i) % len(tetrimino.rotations)].width)
+
+        return x
+
+    def _get_reachable_positions(self, tetrimino, playground):
+        """Yield the (rotations count, x, landing y, placement) of every position the given Tetrimino can be dropped from."""
+        masks = playground.masks
+        rows = playground.rows
+        cols = playground.cols
+        placements = PLACEMENTS[tetrimino.__class__]
+        tops = playground.tops
+        x = tetrimino.x
+        y = tetrimino.y
+        searched = set()
+
+        for rotations in range(0, len(placements)):
+            placement = placements[(tetrimino.rotation + rotations) % len(placements)]
+
+            if rotations:
+                # Rotations are done where the Tetrimino is, so they may be blocked
+                x = min(x, cols - placement.width)
+                y = min(y, rows - placement.height)
+
+                if self._collides(masks, rows, placement, x, y):
+                    break
+
+            # Symmetrical Tetriminos have identical rotation states
+            if placement.cells in searched:
+                continue
+
+            searched.add(placement.cells)
+
+            # Then the Tetrimino is moved sideways as far as it can, in both directions
+            for direction in (-1, 1):
+                position = x if direction == -1 else x + 1
+
+                while 0 <= position <= cols - placement.width and not self._collides(masks, rows, placement, position, y):
+                    landing_y = min(tops[position + col] - 1 - bottom for col, bottom in enumerate(placement.bottoms))
+
+                    if landing_y >= y:
+                        yield rotations, position, landing_y, placement
+
+                    position += direction
+
+    def _collides(self, masks, rows, placement, x, y):
+        """Check if the given placement collides with fallen blocks or the bottom of the playground at the given position."""
+        if y + placement.height > rows:
+            return True
+
+        for dy, mask in enumerate(placement.masks):
+            if masks[y + dy] & mask << x:
+                return True
+
+        return False
+
+    def _evaluate(self, playground, placement, x, y):
+        """Score the playground resulting from placing the given placement at the given position."""
+        self.evaluations += 1
+
+        full = (1 << playground.cols) - 1
+        inner = full >> 1 # Every column but the last one, which has no right neighbour
+        start = min(playground.top, y)
+        masks = playground.masks[start:]
+
+        for dy, mask in enumerate(placement.masks):
+            masks[y - start + dy] |= mask << x
+
+        lines = 0
+        aggregate_height = 0
+        bumpiness = 0
+        covered = 0 # The columns having a block in the current row or above
+
+        for mask in masks:
+            if mask == full: # Completed lines are removed
+                lines += 1
+
+                continue
+
+            covered |= mask
+            aggregate_height += popcount(covered)
+            bumpiness += popcount((covered ^ covered >> 1) & inner)
+
+        blocks = playground.blocks_count + len(placement.cells) - lines * playground.cols
+        weights = self.weights
+
+        # Every covered cell counts in the height of its column, so the holes are the covered cells which aren't filled
+        return weights['lines'] * lines \
+            + weights['holes'] * (aggregate_height - blocks) \
+            + weights['aggregate_height'] * aggregate_height \
+            + weights['bumpiness'] * bumpiness
+
+
+def play_game(seed=None, cols=settings.COLS, rows=settings.ROWS, randomizer=settings.RANDOMIZER, weights=None, max_pieces=None):
+    """Play a whole game without any window, each Tetrimino being dropped once moved to its best placement. Return the engine once the game is over (or max_pieces are placed), along the autoplayer."""
+    game_engine = engine.Engine(cols, rows, randomizers.get_randomizer(randomizer))
+    game_engine.new_game(seed)
+
+    autoplayer = Autoplayer(weights)
+
+    while not game_engine.is_game_over and (max_pieces is None or game_engine.pieces < max_pieces):
+        for action in autoplayer.get_actions(game_engine) or []:
+            game_engine.step(action)
+
+        game_engine.step(Action.DROP)
+
+    return game_engine, autoplayer
+
+
+def run():
+    parser = argparse.ArgumentParser(description='Play games automatically, without any window.')
+    parser.add_argument('--games', type=int, default=1, help='Number of games to play')
+    parser.add_argument('--seed', type=int, help='Seed of the first game, the next ones being played from the next seeds')
+    parser.add_argument('--max-pieces', type=int, default=10000, help='Stop games after this number of placed Tetriminos')
+    parser.add_argument('--cols', type=int, default=settings.COLS)
+    parser.add_argument('--rows', type=int, default=settings.ROWS)
+    parser.add_argument('--randomizer', default=settings.RANDOMIZER, choices=[randomizer.name for randomizer in randomizers.RANDOMIZERS])
+
+    args = parser.parse_args()
+
+    helpers.configure_logging()
+
+    for i in range(0, args.games):
+        seed = args.seed + i if args.seed is not None else None
+
+        started_at = time.perf_counter()
+
+        game_engine, autoplayer = play_game(seed, args.cols, args.rows, args.randomizer, max_pieces=args.max_pieces)
+
+        elapsed = time.perf_counter() - started_at
+
+        logging.info('Seed {:016x}: score {}, {} lines, level {}, {} pieces{} ({} evaluations, {:.1f} per millisecond)'.format(
+            game_engine.seed,
+            game_engine.score,
+            game_engine.lines,
+            game_engine.level,
+            game_engine.pieces,
+            '' if game_engine.is_game_over else ' (not over)',
+            autoplayer.evaluations,
+            autoplayer.evaluations / elapsed / 1000
+        ))
+
+
+if __name__ == '__main__':
+    run()
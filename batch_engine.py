@@ -0,0 +1,230 @@
+"""Simulate many games at once in lockstep, using NumPy arrays.
+
+The rules are the same as the ones of engine.Engine, but every playground is
+stored in a single (boards, rows, cols) array so an action can be applied to
+all the games with a handful of array operations instead of one Python object
+graph per game.
+
+Run this module to measure the throughput of the simulator:
+
+    python batch_engine.py --boards 1000 --steps 1000
+"""
+from engine import Action
+import numpy as np
+import tetriminos
+import argparse
+import settings
+import logging
+import helpers
+import math
+import time
+
+
+# The (x, y) offsets of the cells of each rotation state of each Tetrimino, along their (width, height)
+SHAPES = np.array([[rotation.cells for rotation in getattr(tetriminos, name).rotations] for name in tetriminos.__all__], dtype=np.int16)
+SIZES = np.array([[(rotation.width, rotation.height) for rotation in getattr(tetriminos, name).rotations] for name in tetriminos.__all__], dtype=np.int16)
+
+
+class BatchEngine:
+    """Run a batch of games in lockstep.
+
+    Playgrounds are stored in the boards array, where each cell holds 0 when
+    empty or the index of the Tetrimino class in tetriminos.__all__ plus one."""
+
+    def __init__(self, count, cols=settings.COLS, rows=settings.ROWS, seed=None):
+        self.count = count
+        self.cols = cols
+        self.rows = rows
+        self.spawn_x = math.floor((cols - 1) / 2)
+        self.random = np.random.default_rng(seed)
+
+        self.boards = np.zeros((count, rows, cols), dtype=np.uint8)
+        self.tetrimino = np.zeros(count, dtype=np.int16)
+        self.next_tetrimino = self.random.integers(0, len(tetriminos.__all__), count, dtype=np.int16)
+        self.rotation = np.zeros(count, dtype=np.int16)
+        self.x = np.zeros(count, dtype=np.int16)
+        self.y = np.zeros(count, dtype=np.int16)
+
+        self.level = np.ones(count, dtype=np.int32)
+        self.lines = np.zeros(count, dtype=np.int32)
+        self.score = np.zeros(count, dtype=np.int64)
+        self.is_game_over = np.zeros(count, dtype=bool)
+
+        self.new_game(np.ones(count, dtype=bool))
+
+    def new_game(self, mask):
+        """Start a new game on the boards selected by the given boolean mask."""
+        self.boards[mask] = 0
+        self.level[mask] = 1
+        self.lines[mask] = 0
+        self.score[mask] = 0
+        self.is_game_over[mask] = False
+
+        self._set_current_tetrimino(np.flatnonzero(mask))
+
+    def step(self, actions):
+        """Apply an array of actions (one per board, see engine.Action) to all the running games."""
+        actions = np.where(self.is_game_over, 0, actions)
+
+        for action, direction in ((Action.LEFT, -1), (Action.RIGHT, 1)):
+            index = np.flatnonzero(actions == action)
+            x = self.x[index] + direction
+
+            self._move(index, self.rotation[index], x, self.y[index])
+
+        index = np.flatnonzero(actions == Action.ROTATE)
+        rotation = (self.rotation[index] + 1) % SHAPES.shape[1]
+        size = SIZES[self.tetrimino[index], rotation]
+
+        # Keep the rotated Tetrimino inside the playground, like Tetrimino.rotate() does
+        x = np.minimum(self.x[index], self.cols - size[:, 0])
+        y = np.minimum(self.y[index], self.rows - size[:, 1])
+
+        self._move(index, rotation, x, y)
+
+        index = np.flatnonzero(actions == Action.FALL)
+        fallen = self._move(index, self.rotation[index], self.x[index], self.y[index] + 1)
+
+        self._place(index[~fallen])
+
+        # Dropped Tetriminos fall until every one of them landed, then are placed
+        index = np.flatnonzero(actions == Action.DROP)
+        falling = index
+
+        while len(falling):
+            falling = falling[self._move(falling, self.rotation[falling], self.x[falling], self.y[falling] + 1)]
+
+        self._place(index)
+
+    def _get_cells(self, index, rotation, x, y):
+        """Return the (x, y) coordinates of the cells of the given Tetriminos, as two (len(index), 4) arrays."""
+        shape = SHAPES[self.tetrimino[index], rotation]
+
+        return x[:, None] + shape[:, :, 0], y[:, None] + shape[:, :, 1]
+
+    def _will_collide(self, index, rotation, x, y):
+        """Check if the given Tetriminos would collide with fallen blocks or the playground bounds."""
+        cells_x, cells_y = self._get_cells(index, rotation, x, y)
+
+        outside = (cells_x < 0) | (cells_x >= self.cols) | (cells_y < 0) | (cells_y >= self.rows)
+
+        occupied = self.boards[
+            index[:, None],
+            np.clip(cells_y, 0, self.rows - 1),
+            np.clip(cells_x, 0, self.cols - 1)
+        ] != 0
+
+        return (outside | occupied).any(axis=1)
+
+    def _move(self, index, rotation, x, y):
+        """Move the given Tetriminos to their new state where possible. Return which ones were moved."""
+        moved = ~self._will_collide(index, rotation, x, y)
+        index = index[moved]
+
+        self.rotation[index] = rotation[moved]
+        self.x[index] = x[moved]
+        self.y[index] = y[moved]
+
+        return moved
+
+    def _place(self, index):
+        """Place the current Tetrimino of the given boards, then process the completed lines and spawn the next one."""
+        if not len(index):
+            return
+
+        cells_x, cells_y = self._get_cells(index, self.rotation[index], self.x[index], self.y[index])
+
+        self.boards[index[:, None], cells_y, cells_x] = self.tetrimino[index, None] + 1
+
+        self._process_lines(index)
+        self._set_current_tetrimino(index)
+
+    def _process_lines(self, index):
+        """For each completed lines of the given boards: remove them and make everything to fall."""
+        boards = self.boards[index]
+        completed = (boards != 0).all(axis=2)
+        completed_lines_count = completed.sum(axis=1)
+
+        cleared = completed_lines_count > 0
+
+        if not cleared.any():
+            return
+
+        index = index[cleared]
+        boards = boards[cleared]
+        completed = completed[cleared]
+        completed_lines_count = completed_lines_count[cleared]
+
+        # Move the completed lines to the top (keeping the order of the other ones), then empty them
+        order = np.argsort(~completed, axis=1, kind='stable')
+        boards = np.take_along_axis(boards, order[:, :, None], axis=1)
+        boards[np.arange(self.rows)[None, :] < completed_lines_count[:, None]] = 0
+
+        self.boards[index] = boards
+
+        # Compute and update the score, the same way Engine._process_lines() does
+        score_to_add = completed_lines_count * settings.COMPLETED_LINE_SCORE
+        score_to_add[completed_lines_count == 4] *= 2
+        score_to_add[~boards.any(axis=(1, 2))] *= 2
+
+        self.score[index] += score_to_add
+        self.lines[index] += completed_lines_count
+        self.level[index] = -(-self.lines[index] // settings.LEVEL_INCREASE_LINES_STEP)
+
+    def _set_current_tetrimino(self, index):
+        """Sets the current falling Tetrimino along the next Tetrimino of the given boards."""
+        self.tetrimino[index] = self.next_tetrimino[index]
+        self.next_tetrimino[index] = self.random.integers(0, len(tetriminos.__all__), len(index), dtype=np.int16)
+        self.rotation[index] = 0
+        self.x[index] = self.spawn_x
+        self.y[index] = 0
+
+        # Check if the game is over
+        self.is_game_over[index] = self._will_collide(index, self.rotation[index], self.x[index], self.y[index])
+
+
+def run_benchmark(boards, steps, cols=settings.COLS, rows=settings.ROWS, seed=None):
+    """Play random actions on a batch of games, restarting the ones which are over.
+
+    Return the throughput in boards·steps per second along the amount of finished games."""
+    batch = BatchEngine(boards, cols, rows, seed)
+    actions = np.array([Action.FALL, Action.LEFT, Action.RIGHT, Action.ROTATE], dtype=np.int8)
+    random_actions = batch.random.choice(actions, (steps, boards), p=[0.4, 0.2, 0.2, 0.2])
+    games = 0
+
+    started_at = time.perf_counter()
+
+    for step_actions in random_actions:
+        batch.step(step_actions)
+
+        if batch.is_game_over.any():
+            games += int(batch.is_game_over.sum())
+
+            batch.new_game(batch.is_game_over)
+
+    elapsed = time.perf_counter() - started_at
+
+    return boards * steps / elapsed, games
+
+
+def run():
+    parser = argparse.ArgumentParser(description='Measure the throughput of the batch games simulator.')
+    parser.add_argument('--boards', type=int, default=1000, help='Number of games simulated at once')
+    parser.add_argument('--steps', type=int, default=1000, help='Number of actions applied to each game')
+    parser.add_argument('--cols', type=int, default=settings.COLS)
+    parser.add_argument('--rows', type=int, default=settings.ROWS)
+    parser.add_argument('--seed', type=int, default=None)
+
+    args = parser.parse_args()
+
+    helpers.configure_logging()
+
+    logging.info('Simulating {} boards of {}x{} for {} steps'.format(args.boards, args.cols, args.rows, args.steps))
+
+    throughput, games = run_benchmark(args.boards, args.steps, args.cols, args.rows, args.seed)
+
+    logging.info('{} boards·steps per second ({} games finished)'.format(int(throughput), games))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,346 @@
+"""Measure the time taken by the hot paths of the game, for several playground
+sizes and amounts of fallen blocks.
+
+Results are written to a JSON file, which can be compared to the one of a
+previous run to catch performance regressions:
+
+    python benchmark.py --output after.json --compare before.json
+"""
+import os
+
+# The game frames are rendered without any window nor sound
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import save_game_manager
+import stats_manager
+import subprocess
+import tetriminos
+import platform
+import tempfile
+import argparse
+import settings
+import logging
+import helpers
+import engine
+import random
+import pygame
+import game
+import json
+import time
+import sys
+
+GAME_KEYS = [pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP]
+
+
+def measure(function, min_time, setup=None, counted=False):
+    """Call the given function repeatedly for at least min_time seconds. Return the number of calls and the mean time of a call.
+
+    If a setup function is given, it is called before each call, out of the
+    measured time. If counted, the function returns the number of operations
+    it performed, the time being divided by this number instead."""
+    calls = 0
+    elapsed = 0
+    started_at = time.perf_counter()
+
+    while time.perf_counter() - started_at < min_time:
+        if setup:
+            setup()
+
+            call_started_at = time.perf_counter()
+            function()
+            elapsed += time.perf_counter() - call_started_at
+
+            calls += 1
+        else:
+            call_started_at = time.perf_counter()
+            count = function()
+            elapsed += time.perf_counter() - call_started_at
+
+            calls += count if counted else 1
+
+    return calls, elapsed / calls
+
+
+def fill_playground(playground, fill, seed=0):
+    """Fill the given fraction of the rows of the playground, from the bottom, leaving one hole in each row so none is complete.
+
+    The four topmost rows are always left empty so Tetriminos can still spawn."""
+    rng = random.Random(seed)
+    colors = [getattr(tetriminos, name).background_color for name in tetriminos.__all__]
+    count = min(int(playground.rows * fill), playground.rows - 4)
+
+    playground.clear()
+
+    for y in range(playground.rows - count, playground.rows):
+        hole = rng.randrange(playground.cols)
+
+        for x in range(0, playground.cols):
+            if x != hole:
+                playground.place(x, y, rng.choice(colors))
+
+
+def get_engine(cols, rows, fill):
+    """Return an engine running a game on a playground of the given size, filled with fallen blocks."""
+    game_engine = engine.Engine(cols, rows)
+    game_engine.new_game(0)
+
+    fill_playground(game_engine.playground, fill)
+
+    return game_engine
+
+
+def benchmark_will_collide(cols, rows, fill, min_time):
+    game_engine = get_engine(cols, rows, fill)
+
+    return measure(lambda: game_engine.current_tetrimino.will_collide(game_engine.playground, (0, 1)), min_time)
+
+
+def benchmark_make_it_fall(cols, rows, fill, min_time):
+    game_engine = get_engine(cols, rows, fill)
+
+    def drop():
+        tetrimino = tetriminos.TTetrimino(game_engine.spawn_x, 0)
+        count = 1
+
+        while tetrimino.make_it_fall(game_engine.playground):
+            count += 1
+
+        return count
+
+    return measure(drop, min_time, counted=True)
+
+
+def benchmark_rotate(cols, rows, fill, min_time):
+    game_engine = get_engine(cols, rows, fill)
+    tetrimino = tetriminos.TTetrimino(game_engine.spawn_x, 0)
+
+    return measure(lambda: tetrimino.rotate(game_engine.playground), min_time)
+
+
+def benchmark_process_lines(cols, rows, fill, min_time):
+    """Complete the four bottommost rows then remove them."""
+    game_engine = get_engine(cols, rows, fill)
+    playground = game_engine.playground
+    completed_rows = list(range(rows - 4, rows))
+
+    for y in completed_rows:
+        for x in range(0, cols):
+            if not playground.is_occupied(x, y):
+                playground.place(x, y, tetriminos.ITetrimino.background_color)
+
+    state = (playground.masks.copy(), playground.counts.copy(), playground.colors.copy(), playground.blocks_count, playground.top, playground.tops.copy())
+
+    def restore():
+        playground.masks[:] = state[0]
+        playground.counts[:] = state[1]
+        playground.colors[:] = state[2]
+        playground.blocks_count = state[3]
+        playground.top = state[4]
+        playground.tops[:] = state[5]
+
+    return measure(lambda: game_engine._process_lines(completed_rows), min_time, restore)
+
+
+def benchmark_game_update(cols, rows, fill, min_time):
+    """Render frames in which the current Tetrimino is moved or rotated."""
+    configure_size(cols, rows)
+
+    g = game.Game()
+    g.engine = engine.Engine(cols, rows)
+    g._start_new_game()
+    g._toggle_duration_counter(False)
+
+    fill_playground(g.engine.playground, fill)
+    g._invalidate_drawings()
+    g.update()
+
+    keys = iter(range(0, sys.maxsize))
+
+    def frame():
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=GAME_KEYS[next(keys) % len(GAME_KEYS)]))
+
+        g.update()
+
+    try:
+        return measure(frame, min_time)
+    finally:
+        g.writer.close()
+
+
+def benchmark_save_game(cols, rows, fill, min_time):
+    """Take a snapshot of the game and serialize it, which is what the game thread does (the writing is done in the background)."""
+    game_engine = get_engine(cols, rows, fill)
+
+    return measure(lambda: save_game_manager.dump_snapshot(save_game_manager.get_snapshot(game_engine)), min_time)
+
+
+def benchmark_load_game(cols, rows, fill, min_time):
+    game_engine = get_engine(cols, rows, fill)
+
+    save_game_manager.save_game(settings.SAVE_FILE_NAME, game_engine)
+
+    try:
+        return measure(lambda: save_game_manager.load_game(settings.SAVE_FILE_NAME, game_engine), min_time)
+    finally:
+        os.remove(settings.SAVE_FILE_NAME) # So it isn't loaded by the next game_update benchmark
+
+
+def benchmark_save_stats(min_time):
+    """Take a snapshot of the stats and serialize it, which is what the game thread does (the writing is done in the background)."""
+    return measure(lambda: stats_manager.dump_snapshot(stats_manager.get_snapshot(game.Game.stats)), min_time)
+
+
+def benchmark_load_stats(min_time):
+    stats_manager.save_stats(settings.STATS_FILE_NAME, game.Game.stats)
+
+    return measure(lambda: stats_manager.load_stats(settings.STATS_FILE_NAME, game.Game.stats), min_time)
+
+
+# Benchmarks depending on the playground
+PLAYGROUND_BENCHMARKS = [
+    ('will_collide', benchmark_will_collide),
+    ('make_it_fall', benchmark_make_it_fall),
+    ('rotate', benchmark_rotate),
+    ('process_lines', benchmark_process_lines),
+    ('game_update', benchmark_game_update),
+    ('save_game', benchmark_save_game),
+    ('load_game', benchmark_load_game)
+]
+
+OTHER_BENCHMARKS = [
+    ('save_stats', benchmark_save_stats),
+    ('load_stats', benchmark_load_stats)
+]
+
+
+def configure_size(cols, rows):
+    """Update the settings depending on the size of the playground, like if they were edited."""
+    settings.COLS = cols
+    settings.ROWS = rows
+    settings.PLAYGROUND_BLOCKS_SIDE_SIZE, settings.PLAYGROUND_GRID_SPACING, (settings.PLAYGROUND_WIDTH, settings.PLAYGROUND_HEIGHT) = settings.get_playground_geometry(cols, rows)
+    settings.WINDOW_SIZE = (settings.PLAYGROUND_WIDTH + settings.INFO_PANEL_WIDTH, settings.PLAYGROUND_HEIGHT)
+
+
+def get_commit():
+    """Return the hash of the current Git commit, if available."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, fills, min_time, names=None):
+    """Run the benchmarks. Return the list of the results."""
+    results = []
+
+    def add_result(name, cols, rows, fill, benchmark, *args):
+        logging.disable(logging.INFO) # The game logs aren't relevant here, and would be measured along
+
+        try:
+            calls, seconds = benchmark(*args, min_time)
+        finally:
+            logging.disable(logging.NOTSET)
+
+        logging.info('{:<14} {:>9} fill {:>4} {:>12.2f} µs ({} calls)'.format(
+            name,
+            '{}x{}'.format(cols, rows) if cols else '-',
+            '{:.0%}'.format(fill) if fill is not None else '-',
+            seconds * 1000000,
+            calls
+        ))
+
+        results.append({'name': name, 'cols': cols, 'rows': rows, 'fill': fill, 'calls': calls, 'seconds': seconds})
+
+    for cols, rows in sizes:
+        for fill in fills:
+            for name, benchmark in PLAYGROUND_BENCHMARKS:
+                if not names or name in names:
+                    add_result(name, cols, rows, fill, benchmark, cols, rows, fill)
+
+    for name, benchmark in OTHER_BENCHMARKS:
+        if not names or name in names:
+            add_result(name, None, None, None, benchmark)
+
+    return results
+
+
+def compare_results(results, baseline, threshold):
+    """Log the results which are slower than in the baseline by more than the given ratio. Return their number."""
+    baseline_results = {(result['name'], result['cols'], result['rows'], result['fill']): result['seconds'] for result in baseline['results']}
+    regressions = 0
+
+    for result in results:
+        baseline_seconds = baseline_results.get((result['name'], result['cols'], result['rows'], result['fill']))
+
+        if not baseline_seconds:
+            continue
+
+        ratio = result['seconds'] / baseline_seconds
+
+        if ratio > 1 + threshold:
+            regressions += 1
+
+            logging.warning('Regression: {} {}x{} fill {} is {:.2f} times slower'.format(result['name'], result['cols'], result['rows'], result['fill'], ratio))
+
+    return regressions
+
+
+def parse_size(value):
+    cols, rows = value.lower().split('x')
+
+    return int(cols), int(rows)
+
+
+def run():
+    parser = argparse.ArgumentParser(description='Measure the time taken by the hot paths of the game.')
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[(12, 30), (24, 60), (48, 120), (96, 240)], help='Playground sizes, as COLSxROWS')
+    parser.add_argument('--fills', type=float, nargs='+', default=[0, 0.5, 0.9], help='Fractions of the rows filled with fallen blocks')
+    parser.add_argument('--only', nargs='+', help='Names of the benchmarks to run')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minimum number of seconds each benchmark is run')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='JSON file of previous results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25, help='How much slower than the previous results is a regression')
+
+    args = parser.parse_args()
+
+    helpers.configure_logging()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Nothing must be read from nor written to the files of the player
+        settings.SAVE_FILE_NAME = os.path.join(directory, settings.SAVE_FILE_NAME)
+        settings.STATS_FILE_NAME = os.path.join(directory, settings.STATS_FILE_NAME)
+        settings.HISTORY_FILE_NAME = os.path.join(directory, settings.HISTORY_FILE_NAME)
+        settings.RECORD_REPLAYS = False
+        settings.FPS = 0 # Don't wait between frames
+        settings.MUSIC_VOLUME = 0
+
+        pygame.init()
+
+        results = run_benchmarks(args.sizes, args.fills, args.min_time, args.only)
+
+        pygame.quit()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'commit': get_commit(),
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results
+        }, f, indent=2)
+
+    logging.info('Results written to {}'.format(args.output))
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare_results(results, json.load(f), args.threshold)
+
+        logging.info('{} regressions'.format(regressions))
+
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,177 @@
+import randomizers
+import playground
+import tetriminos
+import settings
+import math
+
+
+class Action:
+    FALL = 1
+    LEFT = 2
+    RIGHT = 3
+    ROTATE = 4
+    DROP = 5
+
+
+class Engine:
+    """The game rules: the playground, the current and next Tetriminos, the
+    score, the level and the game over detection.
+
+    This class doesn't know anything about PyGame, the display or the time:
+    the game only advances when step() is called, so it can be run as fast as
+    possible without any window. Given the same seed and actions, games are
+    always the same."""
+
+    def __init__(self, cols=settings.COLS, rows=settings.ROWS, randomizer=None):
+        self.playground = playground.Playground(cols, rows)
+        self.spawn_x = math.floor((cols - 1) / 2)
+        self.randomizer = randomizer or randomizers.get_randomizer()
+
+        self.current_tetrimino = None
+        self.next_tetrimino = None
+
+        self.level = 1
+        self.lines = 0
+        self.score = 0
+        self.duration = 0
+        self.pieces = 0
+        self.actions = 0 # Number of actions applied since the game started (None if unknown, e.g. loaded from an old save file)
+        self.is_game_over = False
+        self.removed_rows = [] # The rows removed when the latest Tetrimino was placed, sorted
+
+    @property
+    def falling_interval(self):
+        """The number of milliseconds between each fall of the current Tetrimino at the current level."""
+        value = settings.TETRIMINOS_INITIAL_FALLING_INTERVAL - self.level * settings.TETRIMINOS_FALLING_INTERVAL_DECREASE_STEP
+
+        # Prevent the falling interval to reach a value of zero or below,
+        # thus preventing any blocks to fall.
+        # Set an arbitrary - inhuman - value of 10 milliseconds instead so
+        # the player can still - barely - play.
+        # https://github.com/EpocDotFr/tetris/issues/1
+        if value <= 0:
+            value = 10
+
+        return value
+
+    @property
+    def seed(self):
+        """The seed of the sequence of Tetriminos of the current game."""
+        return self.randomizer.seed
+
+    @property
+    def upcoming_tetriminos(self):
+        """The classes of the Tetriminos which will come after the current one, in order."""
+        return [getattr(tetriminos, tetriminos.__all__[index]) for index in self.randomizer.queue]
+
+    def new_game(self, seed=None):
+        """Start a new game, from the given seed or a random one. Return the list of events that happened (see step())."""
+        self.randomizer.reset(seed)
+        self.playground.clear()
+        self.level = 1
+        self.lines = 0
+        self.score = 0
+        self.duration = 0
+        self.pieces = 0
+        self.actions = 0
+        self.is_game_over = False
+        self.removed_rows = []
+
+        return self._set_current_tetrimino()
+
+    def step(self, action):
+        """Apply the given action to the current Tetrimino.
+
+        Return the list of events that happened, amongst "move", "rotate",
+        "place", "lines_completed", "new_level" and "game_over"."""
+        if self.actions is not None:
+            self.actions += 1
+
+        if self.is_game_over:
+            return []
+
+        if action == Action.FALL:
+            return self._make_it_fall()
+        elif action == Action.LEFT:
+            if self.current_tetrimino.move_left(self.playground):
+                return ['move']
+        elif action == Action.RIGHT:
+            if self.current_tetrimino.move_right(self.playground):
+                return ['move']
+        elif action == Action.ROTATE:
+            if self.current_tetrimino.rotate(self.playground):
+                return ['rotate']
+        elif action == Action.DROP:
+            self.current_tetrimino.drop(self.playground)
+
+            return self._make_it_fall()
+
+        return []
+
+    def _make_it_fall(self):
+        """Makes the current Tetrimino to fall, placing it if it can't."""
+        if self.current_tetrimino.make_it_fall(self.playground):
+            return []
+
+        events = ['place']
+
+        self.pieces += 1
+
+        for block in self.current_tetrimino.blocks:
+            self.playground.place(block.x, block.y, block.background_color)
+
+        events.extend(self._process_lines([block.y for block in self.current_tetrimino.blocks]))
+        events.extend(self._set_current_tetrimino())
+
+        return events
+
+    def _set_current_tetrimino(self):
+        """Sets the current falling Tetrimino along the next Tetrimino."""
+        self.current_tetrimino = self._get_tetrimino(self.randomizer.next())(self.spawn_x, 0)
+        self.next_tetrimino = self._get_tetrimino(self.randomizer.peek())
+
+        # Check if the game is over
+        if self.current_tetrimino.will_collide(self.playground):
+            self.is_game_over = True
+
+            return ['game_over']
+
+        return []
+
+    def _get_tetrimino(self, index):
+        """Get a reference to the Tetrimino class of the given index in tetriminos.__all__."""
+        return getattr(tetriminos, tetriminos.__all__[index])
+
+    def _process_lines(self, rows):
+        """For each completed lines amongst the given rows: remove them and make everything to fall."""
+        self.removed_rows = self.playground.remove_full_rows(rows)
+
+        completed_lines_count = len(self.removed_rows)
+
+        if completed_lines_count == 0: # There wasn't any completed lines at all
+            return []
+
+        # Compute and update the score
+        score_to_add = completed_lines_count * settings.COMPLETED_LINE_SCORE
+
+        # If four lines were completed at one time, it's a Tetris, so double the score
+        if completed_lines_count == 4:
+            score_to_add *= 2
+
+        # If the playground is empty after the Tetrimino has fallen and lines has been removed: double the score (again)
+        if self.playground.is_empty():
+            score_to_add *= 2
+
+        self.score += score_to_add
+        self.lines += completed_lines_count
+
+        # Compute and update the new level (if applicable)
+        new_level = len(list(range(0, self.lines, settings.LEVEL_INCREASE_LINES_STEP)))
+
+        # Did we reached a new level of difficulty?
+        if self.level != new_level:
+            self.level = new_level
+
+            return ['new_level']
+
+        return ['lines_completed']
@@ -1,28 +1,31 @@
-from collections import OrderedDict
+from collections import OrderedDict, deque
 import save_game_manager
+import replay_manager
 import stats_manager
-import tetriminos
+import autoplayer
+import threading
+import spectator
 import settings
+import profiler
 import logging
 import helpers
-import random
+import storage
 import pygame
+import engine
 import time
 import sys
 import os
 
+TETRIMINOS_FALLING_EVENT = pygame.USEREVENT + 1
+GAME_DURATION_EVENT = pygame.USEREVENT + 2
+
+MOVES_KEYS = {
+    pygame.K_LEFT: engine.Action.LEFT,
+    pygame.K_RIGHT: engine.Action.RIGHT
+}
 
-class Game:
-    save_data = [
-        'fallen_blocks',
-        'level',
-        'lines',
-        'score',
-        'duration',
-        'current_tetrimino',
-        'next_tetrimino'
-    ]
 
+class Game:
     infos = [
         {'name': 'Level', 'value': 'level', 'format': helpers.humanize_integer},
         {'name': 'Lines', 'value': 'lines', 'format': helpers.humanize_integer},
@@ -38,66 +41,191 @@ class Game:
         ('overall_lines', {'name': 'Overall lines', 'value': 0, 'format': helpers.humanize_integer}),
         ('max_score', {'name': 'Maximum score', 'value': 0, 'format': helpers.humanize_integer}),
         ('max_lines', {'name': 'Maximum lines', 'value': 0, 'format': helpers.humanize_integer}),
-        ('max_level', {'name': 'Maximum level', 'value': 0})
+        ('max_level', {'name': 'Maximum level', 'value': 0}),
+        ('average_score', {'name': 'Average score (last {})'.format(settings.STATS_ROLLING_WINDOW), 'value': 0, 'format': helpers.humanize_integer, 'field': 'score', 'estimator': stats_manager.RollingMean(settings.STATS_ROLLING_WINDOW)}),
+        ('median_score', {'name': 'Median score', 'value': 0, 'format': helpers.humanize_integer, 'field': 'score', 'estimator': stats_manager.StreamingQuantile(0.5)}),
+        ('p90_score', {'name': '90th percentile score', 'value': 0, 'format': helpers.humanize_integer, 'field': 'score', 'estimator': stats_manager.StreamingQuantile(0.9)})
     ])
 
-    def __init__(self):
-        self.clock = pygame.time.Clock()
+    def __init__(self, started_at=None):
+        # Time when the game was launched, to measure how long it takes to display the first frame
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.startup_phase_started_at = time.perf_counter()
+
         self.window = pygame.display.set_mode(settings.WINDOW_SIZE, pygame.DOUBLEBUF)
         self.window_rect = self.window.get_rect()
 
         pygame.display.set_caption('Tetris')
         pygame.display.set_icon(helpers.load_image('icon.png'))
 
-        self.current_tetrimino = None
-        self.next_tetrimino = None
+        self._log_startup_phase('window')
+
+        self._init_logic_state(engine.Engine())
+
         self.started_playing_at = None
+        self.background = None
+        self.background_key = None
+        self.texts = helpers.TextCache(settings.TEXT_CACHE_SIZE)
+        self.overlay = None
+        self.ghost_key = None
+        self.ghost_cells = []
+        self.transparent_background = None
+        self.writer = storage.BackgroundWriter()
+        self.has_unsaved_changes = False
+        self.autosaved_at = time.monotonic()
+        self.next_frame_at = 0
+        self.profiler_surface = None
+        self.profiler_rendered_at = 0
+
+        # Only the drawing phases are measured by the profiler: not the methods calling them (which would count the same time
+        # several times), nor the ones drawing a single cell or block (called so often that measuring them would skew the figures)
+        self.profiled_methods = [
+            '_draw_fallen_blocks',
+            '_draw_ghost',
+            '_draw_blocks',
+            '_draw_info_panel',
+            '_draw_pause_screen',
+            '_draw_game_over_screen',
+            '_draw_stats_screen'
+        ]
+
+        self.profiler = profiler.FrameProfiler(
+            ['events', 'logic', 'wait', 'spectators', 'autosave', 'draw'] + self.profiled_methods + ['profiler', 'display', 'frame'],
+            settings.PROFILER_WINDOW
+        )
+
+        self.music_lock = threading.Lock()
+
+        self._invalidate_drawings()
 
         self._load_fonts()
         self._load_sounds()
 
-        stats_manager.load_stats(settings.STATS_FILE_NAME, self.stats)
+        self._log_startup_phase('assets')
+
+        stats_manager.load_stats(settings.STATS_FILE_NAME, self.stats, settings.HISTORY_FILE_NAME)
+
+        self._log_startup_phase('stats')
+
+        if settings.RECORD_REPLAYS:
+            os.makedirs(settings.REPLAYS_DIRECTORY, exist_ok=True)
 
-        if os.path.isfile(settings.SAVE_FILE_NAME):
-            save_game_manager.load_game(settings.SAVE_FILE_NAME, self, self.save_data)
+        if settings.SPECTATOR_SERVER:
+            self._start_spectator_server()
 
+        if save_game_manager.load_game(settings.SAVE_FILE_NAME, self.engine):
             self.is_fast_falling = False
 
+            self._continue_replay()
+            self._publish_snapshot()
+
             self._load_random_music()
 
             self._toggle_pause(True)
         else:
             self._start_new_game()
 
-    def _load_fonts(self):
-        """Load the fonts."""
-        logging.info('Loading fonts')
+        if settings.PROFILER:
+            self._toggle_profiler(True)
 
-        self.fonts = {
-            'normal': helpers.load_font('coolvetica.ttf', 18),
-            'big': helpers.load_font('coolvetica.ttf', 30)
-        }
+        if settings.AUTOPLAYER:
+            self._toggle_autoplayer(True)
+
+        self._log_startup_phase('game')
+
+    def _init_logic_state(self, game_engine):
+        """Set up everything the game logic needs (logic ticks, events handlers, autoplayer...) to run the game of the given engine.
+
+        Nothing related to the window, the sounds nor the files is involved, so
+        the games run without any window (see replay.py and selfplay.py) only
+        have to call this method."""
+        self.engine = game_engine
+        self.state = settings.GameState.PLAYING
+        self.is_fast_falling = False
+        self.replay_filename = None
+        self.ticks = 0 # Number of logic ticks played in the current game
+        self.logic_updated_at = time.perf_counter()
+        self.logic_lag = 0 # Number of seconds the logic is late on the time
+        self.gravity = 0 # Number of rows the current Tetrimino has to fall
+        self.held_moves = [] # Move actions whose key is held, the last pressed one last
+        self.held_move_ticks = 0 # Number of logic ticks the last pressed move key is held
+        self.autoplayer = None
+        self.is_autoplayed = False # Whether the autoplayer played the current game, even partly
+        self.autoplayed_tetrimino = None
+        self.autoplayer_actions = deque()
+        self.autoplayer_ticks = 0 # Number of logic ticks since the previous action of the autoplayer
+        self.spectator_server = None
+        self.published_tetrimino = None # Where the spectators were last told the falling Tetrimino is
+        self.published_infos = None
+
+        # Placing a Tetrimino updates the drawings, which are only made once there's a window
+        self.dirty_cells = set()
+        self.fallen_layer = None
+
+        self.event_handlers = self._get_event_handlers()
+
+    def _log_startup_phase(self, phase):
+        """Log the time spent in the given startup phase, which just ended."""
+        now = time.perf_counter()
+
+        logging.info('Startup: {} took {:.1f} ms'.format(phase, (now - self.startup_phase_started_at) * 1000))
+
+        self.startup_phase_started_at = now
+
+    def _load_fonts(self):
+        """Prepare the fonts, which are loaded when first used."""
+        self.fonts = helpers.LazyFonts({
+            'normal': ('coolvetica.ttf', 18),
+            'big': ('coolvetica.ttf', 30),
+            'small': ('coolvetica.ttf', 14)
+        })
 
     def _load_sounds(self):
-        """Load the sound effects."""
+        """Load the sound effects in the background. Each one can't be played until it is loaded."""
         logging.info('Loading sounds')
 
-        self.sounds = {
-            'move': helpers.load_sound('move.ogg', volume=settings.SOUNDS_VOLUME),
-            'rotate': helpers.load_sound('rotate.ogg', volume=settings.SOUNDS_VOLUME),
-            'place': helpers.load_sound('place.ogg', volume=settings.SOUNDS_VOLUME),
-            'lines_completed': helpers.load_sound('lines_completed.ogg', volume=settings.SOUNDS_VOLUME),
-            'new_level': helpers.load_sound('new_level.ogg', volume=settings.SOUNDS_VOLUME)
-        }
+        self.sounds = {}
+
+        threading.Thread(target=self._decode_sounds, name='SoundsLoader', daemon=True).start()
+
+    def _decode_sounds(self):
+        """Load the sound effects. Run in a background thread."""
+        started_at = time.perf_counter()
+
+        try:
+            for name in ['move', 'rotate', 'place', 'lines_completed', 'new_level']:
+                self.sounds[name] = helpers.load_sound(name + '.ogg', volume=settings.SOUNDS_VOLUME)
+        except Exception:
+            logging.exception('Unable to load the sounds')
+
+            return
+
+        logging.info('Sounds loaded in {:.1f} ms'.format((time.perf_counter() - started_at) * 1000))
+
+    def _play_sound(self, name):
+        """Play the given sound effect, if it is loaded."""
+        sound = self.sounds.get(name)
+
+        if sound is not None:
+            sound.play()
 
     def _load_random_music(self):
-        """Load and play a random music."""
+        """Load and play a random music in the background."""
         logging.info('Loading random music')
 
-        helpers.load_random_music(
-            ['its_raining_pixels.wav', 'its_always_sunny_in_the_80s.wav'],
-            volume=settings.MUSIC_VOLUME
-        )
+        threading.Thread(target=self._play_random_music, name='MusicLoader', daemon=True).start()
+
+    def _play_random_music(self):
+        """Load and play a random music. Run in a background thread."""
+        # Only one music can be loaded at a time
+        with self.music_lock:
+            try:
+                helpers.load_random_music(
+                    ['its_raining_pixels.wav', 'its_always_sunny_in_the_80s.wav'],
+                    volume=settings.MUSIC_VOLUME
+                )
+            except Exception:
+                logging.exception('Unable to load the music')
 
     def _start_new_game(self):
         """Start a new game."""
@@ -105,80 +233,272 @@ class Game:
 
         self._update_play_time()
 
-        self.fallen_blocks = []
-        self.level = 1
-        self.lines = 0
-        self.score = 0
-        self.duration = 0
-
         self.is_fast_falling = False
+        self.gravity = 0
+        self.is_autoplayed = self.autoplayer is not None
 
         self.started_playing_at = int(time.time())
 
-        self._set_current_tetrimino()
-        self._update_falling_interval()
+        self.engine.new_game()
+        self._start_replay()
+        self._publish_snapshot()
+        self._invalidate_drawings()
         self._toggle_duration_counter(True)
 
         self._load_random_music()
 
         self.state = settings.GameState.PLAYING
 
-    def _update_falling_interval(self, force=None):
-        """Update the Tetrimino's falling event."""
-        if force is not None:
-            pygame.time.set_timer(settings.TETRIMINOS_FALLING_EVENT, force)
-        else:
-            value = settings.TETRIMINOS_INITIAL_FALLING_INTERVAL - self.level * settings.TETRIMINOS_FALLING_INTERVAL_DECREASE_STEP
-
-            # Prevent the falling event timer to reach a value of zero or below,
-            # thus preventing any blocks to fall.
-            # Set an arbitrary - inhuman - value of 10 milliseconds instead so
-            # the player can still - barely - play.
-            # https://github.com/EpocDotFr/tetris/issues/1
-            if value <= 0:
-                value = 10
-
-            pygame.time.set_timer(
-                settings.TETRIMINOS_FALLING_EVENT,
-                value
-            )
-
     def _toggle_duration_counter(self, enable=True):
         """Update the game duration counter event."""
-        pygame.time.set_timer(settings.GAME_DURATION_EVENT, 1000 if enable else 0) # Every seconds
+        pygame.time.set_timer(GAME_DURATION_EVENT, 1000 if enable else 0) # Every seconds
+
+    def _game_over(self):
+        """Called when the current game is over."""
+        self._toggle_duration_counter(False)
+        self.state = settings.GameState.GAME_OVER
+        self._update_play_time()
 
-    def _set_current_tetrimino(self):
-        """Sets the current falling Tetrimino along the next Tetrimino."""
-        if not self.next_tetrimino:
-            self.current_tetrimino = self._get_random_tetrimino()(settings.PLAYGROUND_CENTERX, 0)
+        logging.info('Game over')
+
+        if self.replay_filename:
+            self.writer.append(self.replay_filename, replay_manager.dump_result(self.ticks, self.engine))
+
+            self.replay_filename = None
+
+        if self.spectator_server:
+            self.spectator_server.publish(spectator.get_game_over_message())
+
+        # Games played by the autoplayer don't tell anything about the player
+        if self.is_autoplayed:
+            logging.info('Autoplayed game not counted in the stats')
         else:
-            self.current_tetrimino = self.next_tetrimino(settings.PLAYGROUND_CENTERX, 0)
+            record = stats_manager.get_history_record(self.engine, time.time())
 
-        self.next_tetrimino = self._get_random_tetrimino()
+            self.writer.append(settings.HISTORY_FILE_NAME, stats_manager.dump_history_record(record))
 
-        # Check if the game is over
-        if self.current_tetrimino.will_collide(self.fallen_blocks):
-            self._update_falling_interval(0)
-            self._toggle_duration_counter(False)
-            self.state = settings.GameState.GAME_OVER
-            self._update_play_time()
+            self._update_game_stats(record)
+
+        self._save_stats()
+
+        self.has_unsaved_changes = False
+        self.writer.remove(settings.SAVE_FILE_NAME)
+
+    def _save_game(self):
+        """Save the current game in the background."""
+        self.writer.write(settings.SAVE_FILE_NAME, save_game_manager.dump_snapshot, save_game_manager.get_snapshot(self.engine))
+
+        self.has_unsaved_changes = False
+        self.autosaved_at = time.monotonic()
+
+    def _save_stats(self):
+        """Save the stats in the background."""
+        self.writer.write(settings.STATS_FILE_NAME, stats_manager.dump_snapshot, stats_manager.get_snapshot(self.stats))
+
+    def _autosave(self):
+        """Save the current game if it changed, at most every AUTOSAVE_INTERVAL seconds."""
+        if not settings.AUTOSAVE_INTERVAL or not self.has_unsaved_changes or self.state == settings.GameState.GAME_OVER:
+            return
+
+        if time.monotonic() - self.autosaved_at < settings.AUTOSAVE_INTERVAL:
+            return
+
+        logging.info('Autosaving current game')
+
+        self._save_game()
+
+    def _start_spectator_server(self):
+        """Start broadcasting the game to the spectators, in the background."""
+        self.spectator_server = spectator.SpectatorServer(*settings.SPECTATOR_ADDRESS, settings.SPECTATOR_QUEUE_SIZE)
+
+        try:
+            self.spectator_server.start()
+        except OSError:
+            logging.exception('Unable to start the spectator server')
+
+            self.spectator_server = None
+
+    def _publish_snapshot(self):
+        """Send the whole game to the spectators, which is only needed when a game is started or loaded."""
+        if not self.spectator_server:
+            return
+
+        self.spectator_server.publish(spectator.get_snapshot_message(self.engine))
+
+        self.published_tetrimino = self._get_published_tetrimino()
+        self.published_infos = self._get_published_infos()
+
+    def _publish_to_spectators(self):
+        """Send the falling Tetrimino and the infos to the spectators if they changed since the previous frame.
+
+        Placed Tetriminos and removed rows are sent as soon as they happen (see
+        _step_falling()), as the spectators couldn't guess them."""
+        tetrimino = self._get_published_tetrimino()
+
+        if tetrimino != self.published_tetrimino and not self.engine.is_game_over:
+            self.spectator_server.publish(spectator.get_tetrimino_message(self.engine.current_tetrimino))
+
+            self.published_tetrimino = tetrimino
+
+        infos = self._get_published_infos()
+
+        if infos != self.published_infos:
+            self.spectator_server.publish(spectator.get_infos_message(self.engine))
+
+            self.published_infos = infos
+
+    def _get_published_tetrimino(self):
+        tetrimino = self.engine.current_tetrimino
+
+        return (tetrimino, tetrimino.x, tetrimino.y, tetrimino.rotation)
 
-            logging.info('Game over')
+    def _get_published_infos(self):
+        return (self.engine.score, self.engine.lines, self.engine.level, self.engine.next_tetrimino)
 
-            self._update_game_stats()
-            stats_manager.save_stats(settings.STATS_FILE_NAME, self.stats)
+    def _start_replay(self):
+        """Start recording the replay of the game which was just started."""
+        self.ticks = 0
+        self.replay_filename = replay_manager.get_filename(self.engine.seed) if settings.RECORD_REPLAYS else None
 
-            if os.path.isfile(settings.SAVE_FILE_NAME):
-                os.remove(settings.SAVE_FILE_NAME)
+        if self.replay_filename:
+            self.writer.append(self.replay_filename, replay_manager.dump_header(self.engine))
 
-    def _get_random_tetrimino(self):
-        """Get a random reference to a Tetrimino class."""
-        return getattr(tetriminos, random.choice(tetriminos.__all__))
+    def _continue_replay(self):
+        """Continue recording the replay of the game which was just loaded, if it was recorded until it was saved."""
+        self.replay_filename = None
+
+        if not settings.RECORD_REPLAYS:
+            return
+
+        filename = replay_manager.get_filename(self.engine.seed)
+        ticks = replay_manager.truncate_replay(filename, self.engine.actions)
+
+        if ticks is None:
+            logging.info('Not recording the replay of this game')
+        else:
+            self.replay_filename = filename
+            self.ticks = ticks
+
+    def _step(self, action):
+        """Apply the given action to the game engine, recording it in the replay of the current game."""
+        if self.replay_filename:
+            self.writer.append(self.replay_filename, replay_manager.dump_event(self.ticks, action))
+
+        return self.engine.step(action)
+
+    def _apply(self, action):
+        """Apply the given action of the player. Return whether it had any effect."""
+        events = self._step(action)
+
+        if events:
+            self._process_engine_events(events)
+
+        return bool(events)
+
+    def _run_logic(self):
+        """Run the logic ticks which are due since the previous call, at a fixed rate of TICK_RATE per second."""
+        now = time.perf_counter()
+
+        # Don't try to catch up after a long stall (e.g. the window was moved): the game is simply slowed down
+        self.logic_lag = min(self.logic_lag + now - self.logic_updated_at, settings.MAX_LOGIC_LAG)
+        self.logic_updated_at = now
+
+        tick_duration = 1 / settings.TICK_RATE
+
+        while self.logic_lag >= tick_duration:
+            self.logic_lag -= tick_duration
+
+            self._tick()
+
+    def _tick(self):
+        """Advance the game by one logic tick: make the current Tetrimino fall according to the gravity."""
+        if self.state != settings.GameState.PLAYING:
+            return
+
+        self.ticks += 1
+
+        if self.held_moves:
+            self.held_move_ticks += 1
+
+            self._auto_repeat_move()
+
+        if self.autoplayer:
+            self._autoplay()
+
+        falling_interval = settings.TETRIMINOS_FAST_FALLING_INTERVAL if self.is_fast_falling else self.engine.falling_interval
+
+        # The Tetrimino may fall by more than one row per tick when the falling interval is shorter than a tick
+        self.gravity += 1000 / settings.TICK_RATE / falling_interval
+
+        while self.gravity >= 1 and self.state == settings.GameState.PLAYING:
+            self.gravity -= 1
+
+            self._fall()
+
+    def _autoplay(self):
+        """Let the autoplayer bring the current Tetrimino to its best placement, one action every AUTOPLAYER_INTERVAL milliseconds, then make it fall fast."""
+        if self.engine.current_tetrimino is not self.autoplayed_tetrimino:
+            self.autoplayed_tetrimino = self.engine.current_tetrimino
+            self.autoplayer_actions = deque(self.autoplayer.get_actions(self.engine) or [])
+            self.autoplayer_ticks = 0
+            self.is_fast_falling = False
+
+        self.autoplayer_ticks += 1
+
+        interval = settings.AUTOPLAYER_INTERVAL * settings.TICK_RATE / 1000
+
+        while self.autoplayer_actions and self.autoplayer_ticks >= interval:
+            self.autoplayer_ticks -= interval
+
+            self._apply(self.autoplayer_actions.popleft())
+
+        if not self.autoplayer_actions:
+            self.is_fast_falling = True
+
+    def _auto_repeat_move(self):
+        """Move the current Tetrimino again if the last pressed move key is held for long enough (also known as DAS and ARR)."""
+        action = self.held_moves[-1]
+        direction = (-1, 0) if action == engine.Action.LEFT else (1, 0)
+        moves = self._get_auto_repeat_moves(self.held_move_ticks) - self._get_auto_repeat_moves(self.held_move_ticks - 1)
+
+        for _ in range(moves):
+            # Moves which can't be done aren't even tried, so they aren't recorded in the replay
+            if self.engine.current_tetrimino.will_collide(self.engine.playground, direction):
+                break
+
+            self._apply(action)
+
+    def _get_auto_repeat_moves(self, ticks):
+        """Return the number of repeated moves done once a move key has been held for the given number of logic ticks."""
+        delay = settings.AUTO_REPEAT_DELAY * settings.TICK_RATE / 1000
+
+        if ticks < delay:
+            return 0
+
+        interval = settings.AUTO_REPEAT_INTERVAL * settings.TICK_RATE / 1000
+
+        if not interval: # As far as possible, on every tick
+            return (int(ticks - delay) + 1) * self.engine.playground.cols
+
+        return int((ticks - delay) / interval) + 1
+
+    def _process_engine_events(self, events):
+        """Play the sounds and perform the updates related to what happened in the game engine."""
+        self.has_unsaved_changes = True
+
+        for event in events:
+            if event == 'game_over':
+                self._game_over()
+            else:
+                self._play_sound(event)
+
+            if event in ('lines_completed', 'new_level'):
+                self.is_playground_dirty = True
 
     def _toggle_pause(self, force=None, update_state=True):
         """Toggle pause on/off."""
         if force is False or (force is None and self.state in [settings.GameState.PAUSED, settings.GameState.SHOW_STATS]):
-            self._update_falling_interval()
+            self.gravity = 0
             self._toggle_duration_counter(True)
 
             self.started_playing_at = int(time.time())
@@ -188,7 +508,6 @@ class Game:
 
             logging.info('Game unpaused')
         elif force is True or (force is None and self.state not in [settings.GameState.PAUSED, settings.GameState.SHOW_STATS]):
-            self._update_falling_interval(0)
             self._toggle_duration_counter(False)
             self._update_play_time()
 
@@ -211,6 +530,46 @@ class Game:
 
             logging.info('Showing stats')
 
+    def _toggle_profiler(self, force=None):
+        """Toggle the frame profiler on/off."""
+        if force is False or (force is None and self.profiler.enabled):
+            self.profiler.enabled = False
+
+            # Back to the unmeasured drawing methods of the class
+            for name in self.profiled_methods:
+                delattr(self, name)
+
+            self._invalidate_drawings()
+
+            logging.info('Profiler disabled')
+        elif force is True or (force is None and not self.profiler.enabled):
+            self.profiler.enabled = True
+            self.profiler.reset()
+            self.profiler_surface = None
+
+            for name in self.profiled_methods:
+                setattr(self, name, self.profiler.wrap(name, getattr(self, name)))
+
+            if settings.PROFILER_FILE_NAME and not os.path.isfile(settings.PROFILER_FILE_NAME):
+                self.writer.append(settings.PROFILER_FILE_NAME, self.profiler.dump_header())
+
+            logging.info('Profiler enabled')
+
+    def _toggle_autoplayer(self, force=None):
+        """Toggle the autoplayer on/off."""
+        if force is False or (force is None and self.autoplayer):
+            self.autoplayer = None
+            self.autoplayed_tetrimino = None
+            self.autoplayer_actions.clear()
+            self.is_fast_falling = False
+
+            logging.info('Autoplayer disabled')
+        elif force is True or (force is None and not self.autoplayer):
+            self.autoplayer = autoplayer.Autoplayer()
+            self.is_autoplayed = True
+
+            logging.info('Autoplayer enabled')
+
     def _update_play_time(self):
         """Update the play time in the stats."""
         if self.started_playing_at:
@@ -218,224 +577,463 @@ class Game:
 
             self.started_playing_at = None
 
-    def _update_game_stats(self):
-        """Update the stats data after the game is over."""
-        if self.score > self.stats['max_score']['value']:
-            self.stats['max_score']['value'] = self.score
+    def _update_game_stats(self, record):
+        """Update the stats data from the history record of the game which is over."""
+        if record.score > self.stats['max_score']['value']:
+            self.stats['max_score']['value'] = record.score
 
-        if self.lines > self.stats['max_lines']['value']:
-            self.stats['max_lines']['value'] = self.lines
+        if record.lines > self.stats['max_lines']['value']:
+            self.stats['max_lines']['value'] = record.lines
 
-        if self.level > self.stats['max_level']['value']:
-            self.stats['max_level']['value'] = self.level
+        if record.level > self.stats['max_level']['value']:
+            self.stats['max_level']['value'] = record.level
 
-        if self.duration > self.stats['longest_game']['value']:
-            self.stats['longest_game']['value'] = self.duration
+        if record.duration > self.stats['longest_game']['value']:
+            self.stats['longest_game']['value'] = record.duration
 
-        self.stats['overall_score']['value'] += self.score
-        self.stats['overall_lines']['value'] += self.lines
+        self.stats['overall_score']['value'] += record.score
+        self.stats['overall_lines']['value'] += record.lines
 
         self.stats['games_played']['value'] += 1
 
+        for stat in self.stats.values():
+            if 'estimator' in stat:
+                stat['estimator'].add(getattr(record, stat['field']))
+
+                stat['value'] = round(stat['estimator'].get())
+
         self._update_play_time()
 
-    def _process_lines(self):
-        """For each completed lines: remove them and make everything to fall."""
-        completed_lines = {}
+    def update(self):
+        """Perform every updates of the game logic, events handling and drawing.
+        Also known as the game loop.
 
-        # Count the number of blocks in each lines
-        for block in self.fallen_blocks:
-            if block.y not in completed_lines:
-                completed_lines[block.y] = 0
+        Until it is time to draw the next frame (FPS times per second), events
+        are handled and the logic is advanced as soon as a logic tick (TICK_RATE
+        times per second) is due, so the inputs latency and the game speed
+        don't depend on the frame rate."""
+        frame_profiler = self.profiler if self.profiler.enabled else None
 
-            completed_lines[block.y] += 1
+        if frame_profiler:
+            frame_profiler.start_frame()
 
-        # For each completed lines, remove each block in them
-        for y, total in completed_lines.copy().items():
-            if total == settings.COLS:
-                # The list comprehension to prevent unexpected results when removing from self.fallen_blocks while looping on it
-                for block in [block for block in self.fallen_blocks if block.y == y]:
-                    self.fallen_blocks.remove(block)
-            else:
-                del completed_lines[y] # Remove uncompleted lines counts
+        while True:
+            self._handle_events()
 
-        completed_lines_count = len(completed_lines)
+            if frame_profiler:
+                frame_profiler.mark('events')
 
-        if completed_lines_count == 0: # There wasn't any completed lines at all
-            return
+            self._run_logic()
 
-        # Starting from the topmost line of the playground, make everything above an empty line to fall for one block down
-        for y in range(0, settings.ROWS):
-            if y not in completed_lines:
-                continue
+            if frame_profiler:
+                frame_profiler.mark('logic')
 
-            for block in self.fallen_blocks:
-                if block.y > y or block.is_bottommost():
-                    continue
+            now = time.perf_counter()
 
-                block.y += 1
+            if now >= self.next_frame_at:
+                break
 
-        # Compute and update the score
-        score_to_add = completed_lines_count * settings.COMPLETED_LINE_SCORE
+            # Wait for the next logic tick or frame, whichever comes first
+            time.sleep(max(0, min(self.next_frame_at - now, 1 / settings.TICK_RATE - self.logic_lag)))
 
-        # If four lines were completed at one time, it's a Tetris, so double the score
-        if completed_lines_count == 4:
-            score_to_add *= 2
+            if frame_profiler:
+                frame_profiler.mark('wait')
 
-        # If the playground is empty after the Tetrimino has fallen and lines has been removed: double the score (again)
-        if not self.fallen_blocks:
-            score_to_add *= 2
+        # Frames that couldn't be drawn in time are skipped
+        self.next_frame_at = max(self.next_frame_at + (1 / settings.FPS if settings.FPS else 0), now)
 
-        self.score += score_to_add
-        self.lines += completed_lines_count
+        if self.spectator_server:
+            self._publish_to_spectators()
 
-        # Compute and update the new level (if applicable)
-        new_level = len(list(range(0, self.lines, settings.LEVEL_INCREASE_LINES_STEP)))
+        if frame_profiler:
+            frame_profiler.mark('spectators')
 
-        # Did we reached a new level of difficulty?
-        if self.level != new_level:
-            self.sounds['new_level'].play()
+        self._autosave()
 
-            self.level = new_level
+        if frame_profiler:
+            frame_profiler.mark('autosave')
 
-            if not self.is_fast_falling: # If the player has pressed the down arrow, do not change the speed of the fall
-                self._update_falling_interval()
+        # Drawings and PyGame-related updates
+        if settings.DIRTY_RECTS_RENDERING:
+            rects = self._draw_dirty_rects()
         else:
-            self.sounds['lines_completed'].play()
+            self._draw_everything()
 
-    def update(self):
-        """Perform every updates of the game logic, events handling and drawing.
-        Also known as the game loop."""
+        if frame_profiler:
+            frame_profiler.mark('draw')
 
-        # Events handling
-        for event in pygame.event.get():
-            event_handlers = [
-                self._event_quit,
-                self._event_falling_tetrimino,
-                self._event_game_key,
-                self._event_game_duration
-            ]
+            profiler_rect = self._draw_profiler()
 
-            for handler in event_handlers:
-                if handler(event):
-                    break
+            if settings.DIRTY_RECTS_RENDERING:
+                rects.append(profiler_rect)
 
-        # Drawings
-        self.window.fill(settings.WINDOW_BACKGROUND_COLOR)
+            frame_profiler.mark('profiler')
 
-        self._draw_playground()
+        if settings.DIRTY_RECTS_RENDERING:
+            pygame.display.update(rects)
+        else:
+            pygame.display.update()
+
+        if self.started_at is not None:
+            logging.info('Time to first frame: {:.1f} ms'.format((time.perf_counter() - self.started_at) * 1000))
+
+            self.started_at = None
+
+        if frame_profiler:
+            frame_profiler.mark('display')
+
+            timings = frame_profiler.end_frame()
+
+            if settings.PROFILER_FILE_NAME:
+                self.writer.append(settings.PROFILER_FILE_NAME, frame_profiler.dump_frame(timings))
+
+    def _get_event_handlers(self):
+        """Return the handler of each (event type, key) couple, the key being None for events not related to a key."""
+        event_handlers = {
+            (pygame.QUIT, None): self._event_quit,
+            (pygame.KEYDOWN, pygame.K_ESCAPE): self._event_quit,
+            (pygame.VIDEOEXPOSE, None): self._event_window_exposed,
+            (TETRIMINOS_FALLING_EVENT, None): self._event_falling_tetrimino,
+            (GAME_DURATION_EVENT, None): self._event_game_duration,
+            (pygame.KEYDOWN, pygame.K_PAUSE): self._event_pause_key,
+            (pygame.KEYDOWN, pygame.K_F1): self._event_new_game_key,
+            (pygame.KEYDOWN, pygame.K_F2): self._event_stats_key,
+            (pygame.KEYDOWN, pygame.K_F3): self._event_profiler_key,
+            (pygame.KEYDOWN, pygame.K_F4): self._event_autoplayer_key,
+            (pygame.KEYDOWN, pygame.K_UP): self._event_rotate_key,
+            (pygame.KEYDOWN, pygame.K_DOWN): self._event_fast_fall_key_pressed,
+            (pygame.KEYDOWN, pygame.K_SPACE): self._event_drop_key,
+            (pygame.KEYUP, pygame.K_DOWN): self._event_fast_fall_key_released
+        }
 
-        if self.state != settings.GameState.GAME_OVER:
-            self._draw_blocks(self.current_tetrimino.blocks)
+        for key in MOVES_KEYS:
+            event_handlers[(pygame.KEYDOWN, key)] = self._event_move_key_pressed
+            event_handlers[(pygame.KEYUP, key)] = self._event_move_key_released
 
-        self._draw_blocks(self.fallen_blocks)
-        self._draw_info_panel()
+        return event_handlers
 
-        if self.state == settings.GameState.SHOW_STATS:
-            self._draw_stats_screen()
-        elif self.state == settings.GameState.PAUSED:
-            self._draw_pause_screen()
-        elif self.state == settings.GameState.GAME_OVER:
-            self._draw_game_over_screen()
+    def _handle_events(self):
+        """Call the handler of each pending event, if any."""
+        event_handlers = self.event_handlers
 
-        # PyGame-related updates
-        pygame.display.update()
+        for event in pygame.event.get():
+            handler = event_handlers.get((event.type, getattr(event, 'key', None)))
 
-        self.clock.tick(settings.FPS)
+            if handler:
+                handler(event)
 
     # --------------------------------------------------------------------------
     # Events handlers
 
+    def _event_window_exposed(self, event):
+        """Redraw everything when the content of the window has been lost."""
+        self._invalidate_drawings()
+
     def _event_quit(self, event):
         """Called when the game must be closed."""
-        if event.type == pygame.QUIT or event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-            if self.state != settings.GameState.GAME_OVER:
-                save_game_manager.save_game(settings.SAVE_FILE_NAME, self, self.save_data)
+        if self.state != settings.GameState.GAME_OVER:
+            logging.info('Saving current game')
 
-            self._update_play_time()
-            stats_manager.save_stats(settings.STATS_FILE_NAME, self.stats)
+            self._save_game()
+
+        self._update_play_time()
+        self._save_stats()
 
-            pygame.quit()
-            sys.exit()
+        self.writer.close()
 
-        return False
+        if self.spectator_server:
+            self.spectator_server.close()
+
+        logging.info('Rendered texts cache: {} hits, {} misses'.format(self.texts.hits, self.texts.misses))
+
+        pygame.quit()
+        sys.exit()
 
     def _event_falling_tetrimino(self, event):
+        """Makes the current tetrimino to fall when requested by an event (the gravity is applied by the logic ticks)."""
+        self._fall()
+
+    def _fall(self):
         """Makes the current tetrimino to fall."""
-        if event.type != settings.TETRIMINOS_FALLING_EVENT:
-            return False
+        self._step_falling(engine.Action.FALL)
+
+    def _step_falling(self, action):
+        """Apply the given action which may place the current Tetrimino (a fall or a drop)."""
+        tetrimino = self.engine.current_tetrimino
+        top = min(self.engine.playground.top, tetrimino.y)
+        events = self._step(action)
+
+        if 'place' in events: # The placed Tetrimino may not be where it was last drawn
+            self.dirty_cells.update((block.x, block.y) for block in tetrimino.blocks)
 
-        if not self.current_tetrimino.make_it_fall(self.fallen_blocks):
-            self.sounds['place'].play()
+            self._update_fallen_layer(tetrimino, top)
 
-            self.fallen_blocks.extend(self.current_tetrimino.blocks.copy())
+            if self.spectator_server:
+                self.spectator_server.publish(spectator.get_place_message(tetrimino))
 
-            self._process_lines()
-            self._set_current_tetrimino()
+                if self.engine.removed_rows:
+                    self.spectator_server.publish(spectator.get_remove_message(self.engine.removed_rows))
 
-        return True
+        self._process_engine_events(events)
 
     def _event_game_duration(self, event):
         """Count the duration of the current game."""
-        if event.type != settings.GAME_DURATION_EVENT:
-            return False
+        self.engine.duration += 1
 
-        self.duration += 1
+    def _event_pause_key(self, event):
+        if self.state not in [settings.GameState.GAME_OVER, settings.GameState.SHOW_STATS]:
+            self._toggle_pause()
 
-        return True
+    def _event_new_game_key(self, event):
+        self._start_new_game()
 
-    def _event_game_key(self, event):
-        """Handle the game keys."""
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_PAUSE and self.state not in [settings.GameState.GAME_OVER, settings.GameState.SHOW_STATS]:
-                self._toggle_pause()
+    def _event_stats_key(self, event):
+        self._toggle_stats()
 
-                return True
-            elif event.key == pygame.K_F1:
-                self._start_new_game()
+    def _event_profiler_key(self, event):
+        self._toggle_profiler()
 
-                return True
-            elif event.key == pygame.K_F2:
-                self._toggle_stats()
+    def _event_autoplayer_key(self, event):
+        self._toggle_autoplayer()
 
-                return True
-            elif event.key == pygame.K_LEFT and self.state not in [settings.GameState.PAUSED, settings.GameState.GAME_OVER]:
-                if self.current_tetrimino.move_left(self.fallen_blocks):
-                    self.sounds['move'].play()
+    def _event_move_key_pressed(self, event):
+        """Move the current Tetrimino once, then repeatedly while the key is held (see _auto_repeat_move())."""
+        action = MOVES_KEYS[event.key]
 
-                    return True
-            elif event.key == pygame.K_RIGHT and self.state not in [settings.GameState.PAUSED, settings.GameState.GAME_OVER]:
-                if self.current_tetrimino.move_right(self.fallen_blocks):
-                    self.sounds['move'].play()
+        if action in self.held_moves:
+            self.held_moves.remove(action)
 
-                    return True
-            elif event.key == pygame.K_DOWN and self.state not in [settings.GameState.PAUSED, settings.GameState.GAME_OVER]:
-                self._update_falling_interval(settings.TETRIMINOS_FAST_FALLING_INTERVAL)
-                self.is_fast_falling = True
+        self.held_moves.append(action)
+        self.held_move_ticks = 0
 
-                return True
-            elif event.key == pygame.K_UP and self.state not in [settings.GameState.PAUSED, settings.GameState.GAME_OVER]:
-                if self.current_tetrimino.rotate(self.fallen_blocks):
-                    self.sounds['rotate'].play()
+        if self.state not in [settings.GameState.PAUSED, settings.GameState.GAME_OVER]:
+            self._apply(action)
 
-                    return True
-        elif event.type == pygame.KEYUP:
-            if event.key == pygame.K_DOWN and self.state not in [settings.GameState.PAUSED, settings.GameState.GAME_OVER]:
-                self._update_falling_interval()
-                self.is_fast_falling = False
+    def _event_move_key_released(self, event):
+        action = MOVES_KEYS[event.key]
 
-                return True
+        if action not in self.held_moves:
+            return
+
+        # The move key which was held before, if any, has to be held for the whole delay again
+        if action == self.held_moves[-1]:
+            self.held_move_ticks = 0
+
+        self.held_moves.remove(action)
+
+    def _event_rotate_key(self, event):
+        if self.state not in [settings.GameState.PAUSED, settings.GameState.GAME_OVER]:
+            self._apply(engine.Action.ROTATE)
+
+    def _event_drop_key(self, event):
+        """Makes the current Tetrimino to land at once."""
+        if self.state not in [settings.GameState.PAUSED, settings.GameState.GAME_OVER]:
+            self._step_falling(engine.Action.DROP)
 
-        return False
+            self.gravity = 0
+
+    def _event_fast_fall_key_pressed(self, event):
+        if self.state not in [settings.GameState.PAUSED, settings.GameState.GAME_OVER]:
+            self.is_fast_falling = True
+
+    def _event_fast_fall_key_released(self, event):
+        if self.state not in [settings.GameState.PAUSED, settings.GameState.GAME_OVER]:
+            self.is_fast_falling = False
 
     # --------------------------------------------------------------------------
     # Drawing handlers
 
-    def _draw_playground(self):
-        """Draw the playground."""
+    def _invalidate_drawings(self):
+        """Force the next frame to be fully redrawn."""
+        self.drawn_state = None
+        self.drawn_tetrimino_cells = []
+        self.drawn_ghost_cells = []
+        self.drawn_infos = None
+        self.fallen_layer = None
+        self.dirty_cells = set()
+        self.is_playground_dirty = True
+        self.overlay_key = None
+
+    def _get_drawn_tetrimino_cells(self):
+        """Return the positions of the blocks of the falling Tetrimino, as they should be drawn."""
+        if self.state == settings.GameState.GAME_OVER:
+            return []
+
+        return [(block.x, block.y) for block in self.engine.current_tetrimino.blocks]
+
+    def _get_drawn_ghost_cells(self):
+        """Return the positions of the blocks of the ghost of the falling Tetrimino (where it would land), as they should be drawn."""
+        if not settings.SHOW_GHOST or self.state == settings.GameState.GAME_OVER:
+            return []
+
+        tetrimino = self.engine.current_tetrimino
+
+        # The landing row only changes when the Tetrimino moves sideways or rotates (the playground only changes when it's placed)
+        ghost_key = (tetrimino, tetrimino.x, tetrimino.rotation)
+
+        if ghost_key != self.ghost_key:
+            landing_y = tetrimino.get_landing_y(self.engine.playground)
+
+            self.ghost_cells = [(tetrimino.x + cell_x, landing_y + cell_y) for cell_x, cell_y in tetrimino.rotations[tetrimino.rotation].cells]
+            self.ghost_key = ghost_key
+
+        return self.ghost_cells
+
+    def _get_ghost_color(self, color):
+        """Return the color of the ghost of a Tetrimino of the given color, blended with the playground so it's opaque."""
+        return tuple(round(background + (value - background) * settings.GHOST_OPACITY) for value, background in zip(color, settings.PLAYGROUND_BACKGROUND_COLOR))
+
+    def _get_drawn_infos(self):
+        """Return the values displayed in the information panel."""
+        return tuple(getattr(self.engine, info['value']) for info in self.infos) + (self.engine.next_tetrimino,)
+
+    def _draw_everything(self):
+        """Draw the whole window."""
+        # Overlay screens are composed once, then presented unchanged as long as nothing changes
+        if self.state != settings.GameState.PLAYING:
+            overlay_key = (self.state, self._get_drawn_tetrimino_cells(), self._get_drawn_infos())
+
+            if overlay_key == self.overlay_key:
+                self.window.blit(self.overlay, (0, 0))
+
+                return
+        else:
+            self.overlay_key = None
+
+        self.window.blit(self._get_background(), (0, 0))
+
+        self._draw_fallen_blocks()
+
+        if self.state != settings.GameState.GAME_OVER:
+            self._draw_ghost()
+            self._draw_blocks(self.engine.current_tetrimino.blocks)
+
+        self._draw_info_panel()
+
+        if self.state == settings.GameState.SHOW_STATS:
+            self._draw_stats_screen()
+        elif self.state == settings.GameState.PAUSED:
+            self._draw_pause_screen()
+        elif self.state == settings.GameState.GAME_OVER:
+            self._draw_game_over_screen()
+
+        if self.state != settings.GameState.PLAYING:
+            if self.overlay is not None:
+                self.overlay.blit(self.window, (0, 0))
+            else:
+                self.overlay = self.window.copy()
+
+            self.overlay_key = overlay_key
+
+    def _draw_dirty_rects(self):
+        """Only draw what changed since the previous frame. Return the list of the areas of the window that were updated."""
+        tetrimino_cells = self._get_drawn_tetrimino_cells()
+        ghost_cells = self._get_drawn_ghost_cells()
+        infos = self._get_drawn_infos()
+
+        has_changed = tetrimino_cells != self.drawn_tetrimino_cells or ghost_cells != self.drawn_ghost_cells or infos != self.drawn_infos or self.dirty_cells or self.is_playground_dirty
+
+        # Showing or hiding an overlay screen, or anything changing below it, requires everything to be redrawn
+        if self.state != self.drawn_state or (self.state != settings.GameState.PLAYING and has_changed):
+            self._draw_everything()
+
+            self.drawn_state = self.state
+            self.drawn_tetrimino_cells = tetrimino_cells
+            self.drawn_ghost_cells = ghost_cells
+            self.drawn_infos = infos
+            self.dirty_cells.clear()
+            self.is_playground_dirty = False
+
+            return [self.window_rect]
+
+        if not has_changed:
+            return []
+
+        rects = []
+
+        if self.is_playground_dirty: # Lines were removed: the whole playground moved
+            playground_rect = pygame.Rect((0, 0), (settings.PLAYGROUND_WIDTH, settings.PLAYGROUND_HEIGHT))
+
+            self._draw_fallen_blocks()
+            self._draw_ghost()
+            self._draw_blocks(self.engine.current_tetrimino.blocks)
+
+            rects.append(playground_rect)
+
+            self.is_playground_dirty = False
+        else: # Only the cells the falling Tetrimino left or entered changed, plus the ones of the placed one and its successor
+            cells = set(self.drawn_tetrimino_cells).symmetric_difference(tetrimino_cells)
+            cells.update(set(self.drawn_ghost_cells).symmetric_difference(ghost_cells))
+
+            if self.dirty_cells:
+                cells.update(self.dirty_cells, tetrimino_cells, ghost_cells)
+
+            for x, y in cells:
+                rects.append(self._draw_cell(x, y, tetrimino_cells, ghost_cells))
+
+        self.dirty_cells.clear()
+
+        if infos != self.drawn_infos:
+            # The rightmost line of the playground grid overflows on the information panel by PLAYGROUND_GRID_SPACING pixels
+            info_panel_rect = pygame.Rect((settings.PLAYGROUND_WIDTH + settings.PLAYGROUND_GRID_SPACING, 0), (settings.INFO_PANEL_WIDTH - settings.PLAYGROUND_GRID_SPACING, self.window_rect.h))
+
+            self.window.blit(self._get_background(), info_panel_rect, info_panel_rect)
+            self._draw_info_panel()
+
+            rects.append(info_panel_rect)
+
+        self.drawn_tetrimino_cells = tetrimino_cells
+        self.drawn_ghost_cells = ghost_cells
+        self.drawn_infos = infos
+
+        return rects
+
+    def _draw_cell(self, x, y, tetrimino_cells, ghost_cells):
+        """Redraw a single cell of the playground. Return the area of the window that was updated."""
+        rect = self._get_cell_rect(x, y)
+
+        self.window.blit(self._get_fallen_layer(), rect, rect)
+
+        if (x, y) in tetrimino_cells:
+            self._draw_block(self.engine.current_tetrimino.background_color, x, y)
+        elif (x, y) in ghost_cells:
+            self._draw_block(self._get_ghost_color(self.engine.current_tetrimino.background_color), x, y)
+
+        return rect
+
+    def _get_background(self):
+        """Return the static layer of the window, rendering it again only if the geometry or colors in the settings changed."""
+        key = (
+            self.window_rect.size,
+            settings.COLS,
+            settings.ROWS,
+            settings.BLOCKS_SIDE_SIZE,
+            settings.GRID_SPACING,
+            settings.PLAYGROUND_BLOCKS_SIDE_SIZE,
+            settings.PLAYGROUND_GRID_SPACING,
+            settings.DRAW_GRID,
+            settings.GRID_COLOR,
+            settings.WINDOW_BACKGROUND_COLOR,
+            settings.PLAYGROUND_BACKGROUND_COLOR,
+            settings.TEXT_COLOR
+        )
+
+        if key != self.background_key:
+            logging.info('Rendering static layer')
+
+            self.background = self._render_background()
+            self.background_key = key
+
+        return self.background
+
+    def _render_background(self):
+        """Render everything that never changes: the backgrounds, the playground grid and the information panel labels."""
+        background = pygame.Surface(self.window_rect.size).convert()
+        background.fill(settings.WINDOW_BACKGROUND_COLOR)
+
         # Background behind the playground
         pygame.draw.rect(
-            self.window,
+            background,
             settings.PLAYGROUND_BACKGROUND_COLOR,
             pygame.Rect(
                 (0, 0),
@@ -443,75 +1041,168 @@ class Game:
             )
         )
 
-        # The playground grid (if it should be rendered)
-        if settings.DRAW_GRID:
+        # The playground grid (if it should be rendered, large playgrounds have none)
+        if settings.DRAW_GRID and settings.PLAYGROUND_GRID_SPACING:
             for x in range(0, settings.COLS + 1):
                 pygame.draw.rect(
-                    self.window,
+                    background,
                     settings.GRID_COLOR,
                     pygame.Rect(
-                        (x * settings.BLOCKS_SIDE_SIZE + (x - 1) * settings.GRID_SPACING, 0),
-                        (settings.GRID_SPACING, settings.PLAYGROUND_HEIGHT)
+                        (x * settings.PLAYGROUND_BLOCKS_SIDE_SIZE + (x - 1) * settings.PLAYGROUND_GRID_SPACING, 0),
+                        (settings.PLAYGROUND_GRID_SPACING, settings.PLAYGROUND_HEIGHT)
                     )
                 )
 
             for y in range(0, settings.ROWS + 1):
                 pygame.draw.rect(
-                    self.window,
+                    background,
                     settings.GRID_COLOR,
                     pygame.Rect(
-                        (0, y * settings.BLOCKS_SIDE_SIZE + (y - 1) * settings.GRID_SPACING),
-                        (settings.PLAYGROUND_WIDTH, settings.GRID_SPACING)
+                        (0, y * settings.PLAYGROUND_BLOCKS_SIDE_SIZE + (y - 1) * settings.PLAYGROUND_GRID_SPACING),
+                        (settings.PLAYGROUND_WIDTH, settings.PLAYGROUND_GRID_SPACING)
                     )
                 )
 
-    def _draw_blocks(self, blocks):
-        """Draw a collection of blocks on the playground."""
-        for block in blocks:
-            block.rect.top = block.y * settings.BLOCKS_SIDE_SIZE + block.y * settings.GRID_SPACING
-            block.rect.left = block.x * settings.BLOCKS_SIDE_SIZE + block.x * settings.GRID_SPACING
-
-            self.window.blit(block.image, block.rect)
-
-    def _draw_next_tetrimino(self, x, y):
-        """Draws the next Tetrimino in the info panel."""
-        for pat_y, y_val in enumerate(self.next_tetrimino.pattern):
-            for pat_x, x_val in enumerate(self.next_tetrimino.pattern[pat_y]):
-                if self.next_tetrimino.pattern[pat_y][pat_x] == 1:
-                    block = tetriminos.Block(self.next_tetrimino.background_color, pat_x, pat_y)
-
-                    block.rect.top = block.y * settings.BLOCKS_SIDE_SIZE + block.y * settings.GRID_SPACING + y
-                    block.rect.left = block.x * settings.BLOCKS_SIDE_SIZE + block.x * settings.GRID_SPACING + x
-
-                    self.window.blit(block.image, block.rect)
-
-    def _draw_info_panel(self):
-        """Draws the information panel."""
+        # Labels of the information panel
         next_tetrimino_label = self.fonts['normal'].render('Next', True, settings.TEXT_COLOR)
         next_tetrimino_label_rect = next_tetrimino_label.get_rect()
         next_tetrimino_label_rect.left = settings.PLAYGROUND_WIDTH + 20
         next_tetrimino_label_rect.top = 15
 
-        self.window.blit(next_tetrimino_label, next_tetrimino_label_rect)
+        background.blit(next_tetrimino_label, next_tetrimino_label_rect)
 
-        self._draw_next_tetrimino(settings.PLAYGROUND_WIDTH + 20, next_tetrimino_label_rect.bottom + 10)
+        self.next_tetrimino_top = next_tetrimino_label_rect.bottom + 10
+        self.infos_top = next_tetrimino_label_rect.bottom + 110
 
-        spacing = next_tetrimino_label_rect.bottom + 110
+        spacing = self.infos_top
 
         for info in self.infos:
-            # Label
             info_label = self.fonts['normal'].render(info['name'], True, settings.TEXT_COLOR)
             info_label_rect = info_label.get_rect()
             info_label_rect.left = settings.PLAYGROUND_WIDTH + 20
             info_label_rect.top = spacing
 
-            self.window.blit(info_label, info_label_rect)
+            background.blit(info_label, info_label_rect)
+
+            spacing += 35
+
+        return background
+
+    def _get_fallen_layer(self):
+        """Return the layer of the playground: its background, grid and fallen blocks, rendering it again only if the drawings were invalidated.
+
+        It's kept up to date by _update_fallen_layer() as Tetriminos are placed
+        and lines removed, so the fallen blocks are never drawn again one by one
+        while playing."""
+        if self.fallen_layer is None:
+            self.fallen_layer = self._render_fallen_layer()
+
+        return self.fallen_layer
+
+    def _render_fallen_layer(self):
+        playground_rect = pygame.Rect((0, 0), (settings.PLAYGROUND_WIDTH, settings.PLAYGROUND_HEIGHT))
+        fallen_layer = pygame.Surface(playground_rect.size).convert()
+
+        fallen_layer.blit(self._get_background(), playground_rect, playground_rect)
+
+        side_size = settings.PLAYGROUND_BLOCKS_SIDE_SIZE
+
+        for x, y, color in self.engine.playground:
+            fallen_layer.blit(helpers.get_block_surface(color, side_size), self._get_cell_rect(x, y))
+
+        return fallen_layer
+
+    def _update_fallen_layer(self, tetrimino, top):
+        """Draw the given Tetrimino, which was just placed, on the layer of the playground, then move its content down for each removed row.
+
+        Rows above the given one (the topmost row filled before the Tetrimino
+        was placed) are known to be empty, so they aren't moved."""
+        if self.fallen_layer is None: # Will be rendered from scratch anyway
+            return
+
+        side_size = settings.PLAYGROUND_BLOCKS_SIDE_SIZE
+        pitch = side_size + settings.PLAYGROUND_GRID_SPACING
+        background = self._get_background()
+
+        for block in tetrimino.blocks:
+            self.fallen_layer.blit(helpers.get_block_surface(block.background_color, side_size), self._get_cell_rect(block.x, block.y))
+
+        removed_rows = self.engine.removed_rows
+
+        # Consecutive removed rows are handled at once: everything above them falls by as many rows, from the topmost group to the bottommost one
+        start = 0
+
+        while start < len(removed_rows):
+            end = start
+
+            while end + 1 < len(removed_rows) and removed_rows[end + 1] == removed_rows[end] + 1:
+                end += 1
+
+            count = end - start + 1
+
+            self.fallen_layer.set_clip(pygame.Rect(0, top * pitch, settings.PLAYGROUND_WIDTH, (removed_rows[end] - top) * pitch + side_size))
+            self.fallen_layer.scroll(0, count * pitch)
+            self.fallen_layer.set_clip(None)
+
+            # The rows which were scrolled in are empty
+            empty_rect = pygame.Rect(0, top * pitch, settings.PLAYGROUND_WIDTH, count * pitch - settings.PLAYGROUND_GRID_SPACING)
+
+            self.fallen_layer.blit(background, empty_rect, empty_rect)
 
-            # Value
-            value = getattr(self, info['value'])
+            top += count
+            start = end + 1
+
+    def _get_cell_rect(self, x, y):
+        """Return the area of the window of the cell at the given position of the playground."""
+        return pygame.Rect(
+            (x * (settings.PLAYGROUND_BLOCKS_SIDE_SIZE + settings.PLAYGROUND_GRID_SPACING), y * (settings.PLAYGROUND_BLOCKS_SIDE_SIZE + settings.PLAYGROUND_GRID_SPACING)),
+            (settings.PLAYGROUND_BLOCKS_SIDE_SIZE, settings.PLAYGROUND_BLOCKS_SIDE_SIZE)
+        )
+
+    def _draw_block(self, color, x, y):
+        """Draw a single block at the given position of the playground."""
+        self.window.blit(
+            helpers.get_block_surface(color, settings.PLAYGROUND_BLOCKS_SIDE_SIZE),
+            (x * (settings.PLAYGROUND_BLOCKS_SIDE_SIZE + settings.PLAYGROUND_GRID_SPACING), y * (settings.PLAYGROUND_BLOCKS_SIDE_SIZE + settings.PLAYGROUND_GRID_SPACING))
+        )
+
+    def _draw_blocks(self, blocks):
+        """Draw a collection of blocks on the playground."""
+        for block in blocks:
+            self._draw_block(block.background_color, block.x, block.y)
+
+    def _draw_ghost(self):
+        """Draw the ghost of the falling Tetrimino, where it would land."""
+        color = self._get_ghost_color(self.engine.current_tetrimino.background_color)
+
+        for x, y in self._get_drawn_ghost_cells():
+            self._draw_block(color, x, y)
+
+    def _draw_fallen_blocks(self):
+        """Draw the blocks which have already fallen on the playground, along its background and grid."""
+        self.window.blit(self._get_fallen_layer(), (0, 0))
+
+    def _draw_next_tetrimino(self, x, y):
+        """Draws the next Tetrimino in the info panel."""
+        next_tetrimino = self.engine.next_tetrimino
+
+        # Always drawn with the configured size, even if the playground is scaled down
+        block_surface = helpers.get_block_surface(next_tetrimino.background_color, settings.BLOCKS_SIDE_SIZE)
+
+        for cell_x, cell_y in next_tetrimino.rotations[0].cells:
+            self.window.blit(block_surface, (cell_x * (settings.BLOCKS_SIDE_SIZE + settings.GRID_SPACING) + x, cell_y * (settings.BLOCKS_SIDE_SIZE + settings.GRID_SPACING) + y))
+
+    def _draw_info_panel(self):
+        """Draws the values of the information panel (its labels are part of the static layer)."""
+        self._draw_next_tetrimino(settings.PLAYGROUND_WIDTH + 20, self.next_tetrimino_top)
+
+        spacing = self.infos_top
+
+        for info in self.infos:
+            value = getattr(self.engine, info['value'])
             value_format = info['format'] if 'format' in info else str
 
-            info_value = self.fonts['normal'].render(value_format(value), True, settings.TEXT_COLOR)
+            info_value = self.texts.render(self.fonts['normal'], value_format(value), settings.TEXT_COLOR)
             info_value_rect = info_value.get_rect()
             info_value_rect.right = self.window_rect.w - 20
             info_value_rect.top = spacing
@@ -520,14 +1211,62 @@ class Game:
 
             spacing += 35
 
+    def _draw_profiler(self):
+        """Draws the figures of the frame profiler over the top left corner of the window. Return the area of the window that was updated."""
+        # Figures are only rendered again twice per second, so they are readable
+        if self.profiler_surface is None or time.monotonic() - self.profiler_rendered_at >= 0.5:
+            profiler_surface = self._render_profiler()
+            self.profiler_rendered_at = time.monotonic()
+
+            # What was below the previous figures must be drawn again if they took more space
+            if self.profiler_surface is not None and profiler_surface.get_size() != self.profiler_surface.get_size():
+                self._invalidate_drawings()
+
+            self.profiler_surface = profiler_surface
+
+        return self.window.blit(self.profiler_surface, (5, 5))
+
+    def _render_profiler(self):
+        """Render the figures of the frame profiler, in milliseconds."""
+        font = self.fonts['small']
+        line_height = font.get_linesize()
+        figures = self.profiler.get_figures()
+
+        # The columns of the values are right-aligned after the longest phase name
+        names_width = max([font.size(phase.lstrip('_'))[0] for phase, *values in figures], default=0)
+        columns = [('min', names_width + 50), ('avg', names_width + 95), ('p99', names_width + 140)]
+
+        surface = pygame.Surface((names_width + 150, line_height * (len(figures) + 1) + 10)).convert()
+        surface.fill((0, 0, 0))
+
+        top = 5
+
+        for label, right in columns:
+            label_surface = self.texts.render(font, label, (255, 255, 255))
+
+            surface.blit(label_surface, label_surface.get_rect(right=right, top=top))
+
+        for phase, *values in figures:
+            top += line_height
+
+            surface.blit(self.texts.render(font, phase.lstrip('_'), (255, 255, 255)), (5, top))
+
+            for value, (label, right) in zip(values, columns):
+                value_surface = font.render('{:.2f}'.format(value), True, (255, 255, 255)) # Values change too often to be cached
+
+                surface.blit(value_surface, value_surface.get_rect(right=right, top=top))
+
+        return surface
+
     def _draw_fullscreen_transparent_background(self):
         """Draws a transparent rect that takes the whole window."""
-        rect = pygame.Surface(self.window_rect.size)
-        rect.set_alpha(230)
-        rect.fill(settings.WINDOW_BACKGROUND_COLOR)
+        if self.transparent_background is None:
+            self.transparent_background = pygame.Surface(self.window_rect.size)
+            self.transparent_background.set_alpha(230)
+            self.transparent_background.fill(settings.WINDOW_BACKGROUND_COLOR)
 
         self.window.blit(
-            rect,
+            self.transparent_background,
             pygame.Rect(
                 (0, 0),
                 self.window_rect.size
@@ -542,7 +1281,7 @@ class Game:
         self._draw_fullscreen_transparent_background()
 
         # Title
-        title_label = self.fonts['big'].render(title, True, settings.TEXT_COLOR)
+        title_label = self.texts.render(self.fonts['big'], title, settings.TEXT_COLOR)
         title_label_rect = title_label.get_rect()
         title_label_rect.center = self.window_rect.center
         title_label_rect.centery -= 15
@@ -553,7 +1292,7 @@ class Game:
         spacing = 15
 
         for t in text:
-            text_label = self.fonts['normal'].render(t, True, settings.TEXT_COLOR)
+            text_label = self.texts.render(self.fonts['normal'], t, settings.TEXT_COLOR)
             text_label_rect = text_label.get_rect()
             text_label_rect.center = self.window_rect.center
             text_label_rect.centery += spacing
@@ -569,9 +1308,9 @@ class Game:
     def _draw_game_over_screen(self):
         """Draws the Game over screen."""
         recap_string = [
-            'You completed {} lines, which gained you'.format(self.lines),
-            'to the level {} with a score of {}'.format(self.level, self.score),
-            'in {}.'.format(helpers.humanize_seconds(self.duration)),
+            'You completed {} lines, which gained you'.format(self.engine.lines),
+            'to the level {} with a score of {}'.format(self.engine.level, self.engine.score),
+            'in {}.'.format(helpers.humanize_seconds(self.engine.duration)),
             'Press "F1" to start a new game.'
         ]
 
@@ -582,7 +1321,7 @@ class Game:
         self._draw_fullscreen_transparent_background()
 
         # Title
-        title_label = self.fonts['big'].render('Statistics', True, settings.TEXT_COLOR)
+        title_label = self.texts.render(self.fonts['big'], 'Statistics', settings.TEXT_COLOR)
         title_label_rect = title_label.get_rect()
         title_label_rect.centerx = self.window_rect.centerx
         title_label_rect.top = 20
@@ -594,7 +1333,7 @@ class Game:
 
         for key, stat in self.stats.items():
             # Stat label
-            stat_label = self.fonts['normal'].render(stat['name'], True, settings.TEXT_COLOR)
+            stat_label = self.texts.render(self.fonts['normal'], stat['name'], settings.TEXT_COLOR)
             stat_label_rect = stat_label.get_rect()
             stat_label_rect.left = 40
             stat_label_rect.top = spacing
@@ -604,7 +1343,7 @@ class Game:
             # Stat value
             stat_value_format = stat['format'] if 'format' in stat else str
 
-            stat_value = self.fonts['normal'].render(stat_value_format(stat['value']), True, settings.TEXT_COLOR)
+            stat_value = self.texts.render(self.fonts['normal'], stat_value_format(stat['value']), settings.TEXT_COLOR)
             stat_value_rect = stat_value.get_rect()
             stat_value_rect.right = self.window_rect.w - 40
             stat_value_rect.top = spacing
@@ -1,14 +1,34 @@
+from collections import OrderedDict
+from functools import lru_cache
 from random import choice
 import settings
+import logging
 import pygame
+import sys
 import os
 
 
+@lru_cache(maxsize=None)
+def _get_resources_manifest(root):
+    """Return the set of the (type, filename) of every resource available in the given directory.
+
+    The directory is listed once, instead of checking for each resource file."""
+    manifest = set()
+
+    for res_type in os.listdir(root):
+        res_type_path = os.path.join(root, res_type)
+
+        if os.path.isdir(res_type_path):
+            manifest.update((res_type, filename) for filename in os.listdir(res_type_path))
+
+    return frozenset(manifest)
+
+
 def _get_resource_path(res_type, filename):
     """Get the path to a resource."""
     path = os.path.join(settings.RESOURCES_ROOT, res_type, filename)
 
-    if not os.path.isfile(path):
+    if (res_type, filename) not in _get_resources_manifest(settings.RESOURCES_ROOT):
         raise ValueError('The file ' + path + ' doesn\'t exist')
 
     return path
@@ -53,6 +73,61 @@ def load_random_music(filenames, play=True, volume=0.5):
     load_music(choice(filenames), play, volume)
 
 
+_block_surfaces = {}
+
+
+def get_block_surface(color, size):
+    """Return the surface of a block of the given color and size.
+
+    Surfaces are created once and shared by every block having the same color
+    and size."""
+    key = (color, size)
+
+    if key not in _block_surfaces:
+        if len(color) == 4: # Only use per-pixel alpha when really needed as opaque surfaces are faster to blit
+            surface = pygame.Surface((size, size), pygame.SRCALPHA, 32).convert_alpha()
+        else:
+            surface = pygame.Surface((size, size)).convert()
+
+        surface.fill(color)
+
+        _block_surfaces[key] = surface
+
+    return _block_surfaces[key]
+
+
+class TextCache:
+    """A bounded, least recently used cache of rendered texts."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color):
+        """Return the surface of the given text rendered (antialiased) with the given font and color."""
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+
+            return surface
+
+        self.misses += 1
+
+        surface = font.render(text, True, color)
+
+        self.surfaces[key] = surface
+
+        if len(self.surfaces) > self.max_size: # Forget about the least recently used text
+            self.surfaces.popitem(last=False)
+
+        return surface
+
+
 def load_font(filename, size):
     """Load a font file."""
     path = _get_resource_path('fonts', filename)
@@ -60,6 +135,22 @@ def load_font(filename, size):
     return pygame.font.Font(path, size)
 
 
+class LazyFonts(dict):
+    """The fonts of the game by name, each one being loaded when first used."""
+
+    def __init__(self, fonts):
+        super(LazyFonts, self).__init__()
+
+        self.fonts = fonts # Name: (filename, size)
+
+    def __missing__(self, name):
+        filename, size = self.fonts[name]
+
+        font = self[name] = load_font(filename, size)
+
+        return font
+
+
 def humanize_seconds(seconds):
     """Return a human-readable representation of the given number of seconds."""
     if not seconds:
@@ -95,3 +186,14 @@ def humanize_integer(integer):
         return '0'
 
     return format(integer, ',d').replace(',', ' ')
+
+
+def configure_logging():
+    """Log the INFO messages and above to the standard output, as every script of the game does."""
+    logging.basicConfig(
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%d/%m/%Y %H:%M:%S',
+        stream=sys.stdout
+    )
+
+    logging.getLogger().setLevel(logging.INFO)
@@ -0,0 +1,160 @@
+class Playground:
+    """The grid holding the fallen blocks.
+
+    Occupancy is stored as one integer bitmask per row (bit x is set when the
+    cell at column x is filled) and the colors in a flat list indexed by
+    y * cols + x, so every lookup or placement is O(1) regardless of how many
+    blocks have fallen.
+
+    The number of blocks in each row as well as the topmost filled row are
+    maintained along, so completed lines can be found and removed without
+    looking at the whole playground. So is the topmost filled row of each
+    column (the heights profile), so where a Tetrimino lands can be found
+    without looking at the rows at all."""
+
+    def __init__(self, cols, rows):
+        self.cols = cols
+        self.rows = rows
+
+        self.clear()
+
+    def clear(self):
+        """Remove every block from the playground."""
+        self.masks = [0] * self.rows
+        self.counts = [0] * self.rows
+        self.colors = [None] * (self.cols * self.rows)
+        self.blocks_count = 0
+        self.top = self.rows # Index of the topmost non-empty row (self.rows if the playground is empty)
+        self.tops = [self.rows] * self.cols # Index of the topmost filled row of each column (self.rows if the column is empty)
+
+    def __iter__(self):
+        """Iterate over the fallen blocks as (x, y, color) tuples."""
+        for y in range(self.top, self.rows):
+            mask = self.masks[y]
+
+            if not mask:
+                continue
+
+            offset = y * self.cols
+
+            for x in range(0, self.cols):
+                if mask >> x & 1:
+                    yield x, y, self.colors[offset + x]
+
+    def set_colors(self, colors):
+        """Replace every cell of the playground by the given flat list of colors (None for empty cells), row by row."""
+        self.clear()
+
+        cols = self.cols
+
+        for y in range(0, self.rows):
+            row = colors[y * cols:(y + 1) * cols]
+            mask = 0
+
+            for x, color in enumerate(row):
+                if color is not None:
+                    mask |= 1 << x
+
+            if not mask:
+                continue
+
+            for x, color in enumerate(row):
+                if color is not None and self.tops[x] == self.rows:
+                    self.tops[x] = y
+
+            count = cols - row.count(None)
+
+            self.masks[y] = mask
+            self.counts[y] = count
+            self.colors[y * cols:(y + 1) * cols] = row
+            self.blocks_count += count
+
+            if y < self.top:
+                self.top = y
+
+    def is_empty(self):
+        """Check if there isn't any block on the playground."""
+        return self.blocks_count == 0
+
+    def is_inside(self, x, y):
+        """Check if the given position is within the bounds of the playground."""
+        return 0 <= x < self.cols and 0 <= y < self.rows
+
+    def is_occupied(self, x, y):
+        """Check if the given position is filled or outside the playground."""
+        if not self.is_inside(x, y):
+            return True
+
+        return self.masks[y] >> x & 1 == 1
+
+    def get_color(self, x, y):
+        """Return the color of the block at the given position, if any."""
+        return self.colors[y * self.cols + x]
+
+    def place(self, x, y, color):
+        """Fill the cell at the given position with a block of the given color."""
+        self.masks[y] |= 1 << x
+        self.colors[y * self.cols + x] = color
+        self.counts[y] += 1
+        self.blocks_count += 1
+
+        if y < self.top:
+            self.top = y
+
+        if y < self.tops[x]:
+            self.tops[x] = y
+
+    def is_row_full(self, y):
+        """Check if the given row is completely filled."""
+        return self.counts[y] == self.cols
+
+    def remove_full_rows(self, rows):
+        """Remove the completed rows amongst the given ones, making everything above them to fall.
+
+        Only the rows between the topmost filled one and the bottommost removed
+        one are moved, all in a single pass. Return the sorted list of the
+        removed rows."""
+        removed = sorted(y for y in set(rows) if self.is_row_full(y))
+
+        if not removed:
+            return removed
+
+        cols = self.cols
+        top = self.top
+        bottom = removed[-1]
+        kept = [y for y in range(top, bottom + 1) if y not in removed]
+        start = top + len(removed) # Where the kept rows will begin once compacted
+
+        self.masks[start:bottom + 1] = [self.masks[y] for y in kept]
+        self.counts[start:bottom + 1] = [self.counts[y] for y in kept]
+        self.colors[start * cols:(bottom + 1) * cols] = [color for y in kept for color in self.colors[y * cols:(y + 1) * cols]]
+
+        self.masks[top:start] = [0] * len(removed)
+        self.counts[top:start] = [0] * len(removed)
+        self.colors[top * cols:start * cols] = [None] * (len(removed) * cols)
+
+        self.blocks_count -= len(removed) * cols
+        self.top = start
+
+        while self.top < self.rows and not self.counts[self.top]:
+            self.top += 1
+
+        # Every column has a block in the removed rows, so its topmost block is above them and falls by as many rows,
+        # unless it was itself removed: the column is then looked at from the top to find its new topmost block
+        removed_rows = set(removed)
+        masks = self.masks
+
+        for x in range(0, cols):
+            if self.tops[x] not in removed_rows:
+                self.tops[x] += len(removed)
+
+                continue
+
+            y = self.top
+
+            while y < self.rows and not masks[y] >> x & 1:
+                y += 1
+
+            self.tops[x] = y
+
+        return removed
@@ -0,0 +1,88 @@
+from collections import deque
+import time
+
+
+class FrameProfiler:
+    """Measure the time spent in each phase of the frames.
+
+    Phases are either measured in sequence with mark(), the time elapsed since
+    the previous mark being attributed to the given phase, or by wrapping
+    functions with wrap(), every call adding to the time of the phase named
+    after the function. The times of the latest frames (at most window of them)
+    are kept to compute rolling figures."""
+
+    def __init__(self, phases, window):
+        self.phases = phases
+        self.enabled = False
+        self.frames_count = 0
+        self.timings = {phase: deque(maxlen=window) for phase in phases}
+        self.current = dict.fromkeys(phases, 0.0)
+        self.frame_started_at = 0
+        self.marked_at = 0
+
+    def reset(self):
+        """Forget about the previously measured frames."""
+        self.frames_count = 0
+
+        for timings in self.timings.values():
+            timings.clear()
+
+    def start_frame(self):
+        self.current = dict.fromkeys(self.phases, 0.0)
+        self.frame_started_at = self.marked_at = time.perf_counter()
+
+    def mark(self, phase):
+        """Attribute the time elapsed since the previous mark (or the start of the frame) to the given phase."""
+        now = time.perf_counter()
+
+        self.current[phase] += now - self.marked_at
+        self.marked_at = now
+
+    def end_frame(self):
+        """Record the times of the current frame. Return them, in seconds, by phase."""
+        self.current['frame'] = time.perf_counter() - self.frame_started_at
+        self.frames_count += 1
+
+        for phase, value in self.current.items():
+            self.timings[phase].append(value)
+
+        return self.current
+
+    def wrap(self, phase, function):
+        """Return a version of the given function adding the time spent in each of its calls to the given phase."""
+        def wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.current[phase] += time.perf_counter() - started_at
+
+        return wrapper
+
+    def get_figures(self):
+        """Return the minimum, average and 99th percentile times (in milliseconds) of the phases which took any, as (phase, min, avg, p99) tuples."""
+        figures = []
+
+        for phase in self.phases:
+            timings = sorted(self.timings[phase])
+
+            if not timings or not timings[-1]:
+                continue
+
+            figures.append((
+                phase,
+                timings[0] * 1000,
+                sum(timings) / len(timings) * 1000,
+                timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+            ))
+
+        return figures
+
+    def dump_header(self):
+        """Return the header line of the CSV file of the frames timings."""
+        return (','.join(self.phases) + '\n').encode('ascii')
+
+    def dump_frame(self, timings):
+        """Return the line of the CSV file of the frames timings for the given frame timings, in microseconds."""
+        return (','.join(str(round(timings[phase] * 1000000)) for phase in self.phases) + '\n').encode('ascii')
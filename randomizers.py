@@ -0,0 +1,131 @@
+"""Generate the sequence of Tetriminos of a game.
+
+A randomizer is seeded explicitly and only relies on its own pseudo-random
+number generator, so the same seed always gives the same sequence of
+Tetriminos, whatever the platform or the Python version. Tetriminos are
+identified by their index in tetriminos.__all__."""
+from collections import deque
+import tetriminos
+import settings
+import os
+
+MASK = 0xFFFFFFFFFFFFFFFF # Numbers are unsigned 64 bits integers
+
+
+class Randomizer:
+    """Base class of the randomizers: the upcoming Tetriminos are generated in
+    advance in a queue of the given length, which can be looked at without
+    affecting the sequence."""
+
+    name = None
+
+    def __init__(self, lookahead=settings.LOOKAHEAD, seed=None):
+        self.lookahead = max(1, lookahead)
+
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """Restart the sequence from the given seed, or from a random one."""
+        if seed is None:
+            seed = int.from_bytes(os.urandom(8), 'little')
+
+        self.seed = seed & MASK
+        self.state = self.seed
+        self.queue = deque()
+
+        self._reset()
+
+        while len(self.queue) < self.lookahead:
+            self.queue.append(self._generate())
+
+    def next(self):
+        """Return the index of the next Tetrimino, removing it from the queue."""
+        self.queue.append(self._generate())
+
+        return self.queue.popleft()
+
+    def peek(self, position=0):
+        """Return the index of the Tetrimino at the given position in the queue, without removing it."""
+        return self.queue[position]
+
+    def get_state(self):
+        """Return everything needed to continue the sequence, as a (seed, state, queue, bag) tuple."""
+        return self.seed, self.state, list(self.queue), []
+
+    def set_state(self, seed, state, queue, bag):
+        """Continue the sequence from a state previously returned by get_state()."""
+        self.seed = seed
+        self.state = state
+        self.queue = deque(queue)
+
+        while len(self.queue) < self.lookahead:
+            self.queue.append(self._generate())
+
+    def _random(self, count):
+        """Return a pseudo-random integer between 0 and the given count (excluded), using SplitMix64."""
+        self.state = (self.state + 0x9E3779B97F4A7C15) & MASK
+
+        value = self.state
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK
+        value ^= value >> 31
+
+        return value % count
+
+    def _reset(self):
+        pass
+
+    def _generate(self):
+        raise NotImplementedError()
+
+
+class UniformRandomizer(Randomizer):
+    """Every Tetrimino has the same chances to come next, whatever came before."""
+
+    name = 'uniform'
+
+    def _generate(self):
+        return self._random(len(tetriminos.__all__))
+
+
+class BagRandomizer(Randomizer):
+    """The Tetriminos are drawn from a shuffled bag containing each of them once,
+    which is refilled once empty: there can't be more than 12 Tetriminos between
+    two identical ones."""
+
+    name = 'bag'
+
+    def get_state(self):
+        return self.seed, self.state, list(self.queue), self.bag.copy()
+
+    def set_state(self, seed, state, queue, bag):
+        self.bag = list(bag)
+
+        super(BagRandomizer, self).set_state(seed, state, queue, bag)
+
+    def _reset(self):
+        self.bag = []
+
+    def _generate(self):
+        if not self.bag:
+            self.bag = list(range(0, len(tetriminos.__all__)))
+
+            # Fisher-Yates shuffle
+            for i in range(len(self.bag) - 1, 0, -1):
+                j = self._random(i + 1)
+
+                self.bag[i], self.bag[j] = self.bag[j], self.bag[i]
+
+        return self.bag.pop()
+
+
+RANDOMIZERS = [UniformRandomizer, BagRandomizer]
+
+
+def get_randomizer(name=settings.RANDOMIZER, lookahead=settings.LOOKAHEAD, seed=None):
+    """Instantiate the randomizer of the given name."""
+    for randomizer_class in RANDOMIZERS:
+        if randomizer_class.name == name:
+            return randomizer_class(lookahead, seed)
+
+    raise ValueError('Unknown randomizer "{}"'.format(name))
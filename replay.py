@@ -0,0 +1,142 @@
+"""Replay recorded games as fast as possible, without any window, and check
+they still end the same way.
+
+The recorded actions are fed to the same event handlers as when playing, so
+any change in the game rules which alters the outcome of a game is caught.
+Run this module with replay files (see settings.RECORD_REPLAYS) or
+directories containing them:
+
+    python replay.py replays
+"""
+from engine import Action
+import replay_manager
+import randomizers
+import argparse
+import settings
+import logging
+import helpers
+import engine
+import pygame
+import time
+import game
+import sys
+import os
+
+ACTIONS_KEYS = {
+    Action.LEFT: pygame.K_LEFT,
+    Action.RIGHT: pygame.K_RIGHT,
+    Action.ROTATE: pygame.K_UP,
+    Action.DROP: pygame.K_SPACE
+}
+
+
+class ReplayGame(game.Game):
+    """The game logic alone, fed with the events of a replay file."""
+
+    def __init__(self, header):
+        self._init_logic_state(engine.Engine(header.cols, header.rows, randomizers.RANDOMIZERS[header.randomizer]()))
+
+        self.engine.new_game(header.seed)
+
+    def play(self, events):
+        """Feed the given (tick, action) events to the event handlers."""
+        falling_event = pygame.event.Event(game.TETRIMINOS_FALLING_EVENT)
+        keys_events = {action: pygame.event.Event(pygame.KEYDOWN, key=key) for action, key in ACTIONS_KEYS.items()}
+
+        for tick, action in events:
+            if action == Action.FALL:
+                self._event_falling_tetrimino(falling_event)
+            else:
+                key_event = keys_events[action]
+
+                self.event_handlers[(key_event.type, key_event.key)](key_event)
+
+            self.dirty_cells.clear()
+
+    def _process_engine_events(self, events):
+        if 'game_over' in events:
+            self.state = settings.GameState.GAME_OVER
+
+
+def verify_replay(filename):
+    """Replay the given replay file. Return whether the game ended the same way, along the number of replayed events.
+
+    Unfinished games can't be checked and are considered as matching."""
+    header, events, result = replay_manager.load_replay(filename)
+
+    replay_game = ReplayGame(header)
+    replay_game.play(events)
+
+    replayed_engine = replay_game.engine
+
+    if result is None:
+        logging.info('{}: unfinished game, now at score {}, {} lines'.format(filename, replayed_engine.score, replayed_engine.lines))
+
+        return True, len(events)
+
+    replayed_result = replay_manager.Result(
+        replayed_engine.score,
+        replayed_engine.lines,
+        replayed_engine.level,
+        replay_manager.get_playground_checksum(replayed_engine.playground)
+    )
+
+    if replayed_result != result or not replayed_engine.is_game_over:
+        logging.error('{}: mismatch, recorded {} but replayed {}{}'.format(
+            filename,
+            result,
+            replayed_result,
+            '' if replayed_engine.is_game_over else ' (game not over)'
+        ))
+
+        return False, len(events)
+
+    return True, len(events)
+
+
+def get_filenames(paths):
+    """Return the replay files amongst the given paths, looking into directories."""
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith('.replay'):
+                    yield os.path.join(path, filename)
+        else:
+            yield path
+
+
+def run():
+    parser = argparse.ArgumentParser(description='Replay recorded games and check they still end the same way.')
+    parser.add_argument('paths', nargs='*', default=[settings.REPLAYS_DIRECTORY], help='Replay files or directories containing them')
+
+    args = parser.parse_args()
+
+    helpers.configure_logging()
+
+    replays = 0
+    mismatches = 0
+    events = 0
+
+    started_at = time.perf_counter()
+
+    for filename in get_filenames(args.paths):
+        try:
+            matches, count = verify_replay(filename)
+        except (OSError, ValueError) as e:
+            logging.error('{}: {}'.format(filename, e))
+
+            matches, count = False, 0
+
+        replays += 1
+        mismatches += not matches
+        events += count
+
+    elapsed = time.perf_counter() - started_at
+
+    logging.info('{} replays checked, {} mismatches ({} events in {:.2f} seconds)'.format(replays, mismatches, events, elapsed))
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,149 @@
+from collections import namedtuple
+import save_game_manager
+import randomizers
+import settings
+import storage
+import struct
+import zlib
+import os
+
+# A replay file is made of this header, followed by one event record for each
+# action applied to the game engine, in order. Once the game is over, an event
+# record with the END action is appended, followed by the result record.
+MAGIC = b'TTRR'
+VERSION = 1
+
+HEADER = struct.Struct(
+    '<' # Little-endian, no padding
+    '4s' # Magic
+    'B' # Version
+    'HH' # Playground columns and rows
+    'BQ' # Randomizer index (in randomizers.RANDOMIZERS) and seed
+)
+
+EVENT = struct.Struct(
+    '<' # Little-endian, no padding
+    'I' # Tick: number of logic ticks played since the game started
+    'B' # Action (see engine.Action)
+)
+
+RESULT = struct.Struct(
+    '<' # Little-endian, no padding
+    'Q' # Score
+    'II' # Lines and level
+    'I' # CRC32 of the playground (see get_playground_checksum())
+)
+
+END = 0 # The action of the event record marking the end of the game
+
+Header = namedtuple('Header', ['cols', 'rows', 'randomizer', 'seed'])
+Result = namedtuple('Result', ['score', 'lines', 'level', 'checksum'])
+
+
+def get_filename(seed):
+    """Return the name of the replay file of the game started from the given seed."""
+    return os.path.join(settings.REPLAYS_DIRECTORY, '{:016x}.replay'.format(seed))
+
+
+def get_playground_checksum(playground):
+    """Return a checksum of the content of the given playground."""
+    return zlib.crc32(bytes(save_game_manager.COLORS_INDEXES[color] for color in playground.colors))
+
+
+def dump_header(engine):
+    """Return the header of the replay file of the game which was just started by the given engine."""
+    return HEADER.pack(
+        MAGIC,
+        VERSION,
+        engine.playground.cols,
+        engine.playground.rows,
+        randomizers.RANDOMIZERS.index(engine.randomizer.__class__),
+        engine.seed
+    )
+
+
+def dump_event(tick, action):
+    """Return the event record of the given action."""
+    return EVENT.pack(tick, action)
+
+
+def dump_result(tick, engine):
+    """Return the records marking the end of the game of the given engine."""
+    return EVENT.pack(tick, END) + RESULT.pack(
+        engine.score,
+        engine.lines,
+        engine.level,
+        get_playground_checksum(engine.playground)
+    )
+
+
+def truncate_replay(filename, events):
+    """Cut the replay file of an unfinished game right after the given number of events, which were applied when the game was saved.
+
+    Events recorded after the game was saved (e.g. it was then killed) are
+    removed, as the game continues from the save. Return the tick of the
+    latest kept event, which the recording should be continued from, or None
+    if it can't be: the file is missing, of another version, has fewer events
+    or the number of events is unknown."""
+    if events is None or not os.path.isfile(filename):
+        return None
+
+    size = HEADER.size + events * EVENT.size
+
+    with open(filename, 'rb') as f:
+        data = f.read(HEADER.size)
+
+        if len(data) < HEADER.size or HEADER.unpack(data)[:2] != (MAGIC, VERSION):
+            return None
+
+        if f.seek(0, os.SEEK_END) < size:
+            return None
+
+        tick = 0
+
+        if events:
+            f.seek(size - EVENT.size)
+
+            tick, action = EVENT.unpack(f.read(EVENT.size))
+
+            if action == END:
+                return None
+
+    storage.truncate(filename, size)
+
+    return tick
+
+
+def load_replay(filename):
+    """Read a replay file. Return its header, the list of its (tick, action) events and its result (None if the game isn't over).
+
+    A partially written record at the end of the file is ignored."""
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    try:
+        magic, version, cols, rows, randomizer, seed = HEADER.unpack_from(data)
+    except struct.error as e:
+        raise ValueError('Invalid replay file: {}'.format(e))
+
+    if magic != MAGIC:
+        raise ValueError('Invalid replay file: not a replay')
+
+    if version != VERSION:
+        raise ValueError('Unsupported replay file version {}'.format(version))
+
+    events = []
+    result = None
+
+    for offset in range(HEADER.size, len(data) - EVENT.size + 1, EVENT.size):
+        tick, action = EVENT.unpack_from(data, offset)
+
+        if action == END:
+            if len(data) >= offset + EVENT.size + RESULT.size:
+                result = Result(*RESULT.unpack_from(data, offset + EVENT.size))
+
+            break
+
+        events.append((tick, action))
+
+    return Header(cols, rows, randomizer, seed), events, result
@@ -1,21 +1,18 @@
 import logging
+import helpers
 import pygame
 import game
-import sys
+import time
 import os
 
 
 def run():
+    started_at = time.perf_counter()
+
     if 'SDL_VIDEO_WINDOW_POS' not in os.environ:
         os.environ['SDL_VIDEO_CENTERED'] = '1' # This makes the window centered on the screen
 
-    logging.basicConfig(
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%d/%m/%Y %H:%M:%S',
-        stream=sys.stdout
-    )
-
-    logging.getLogger().setLevel(logging.INFO)
+    helpers.configure_logging()
 
     logging.info('Initializing PyGame/{} (with SDL/{})'.format(
         pygame.version.ver,
@@ -25,9 +22,11 @@ def run():
     pygame.mixer.pre_init(0, 0, 4, 2048) # Zeros makes PyGame to use default values
     pygame.init()
 
+    logging.info('Startup: PyGame initialization took {:.1f} ms'.format((time.perf_counter() - started_at) * 1000))
+
     logging.info('Initializing game')
 
-    g = game.Game()
+    g = game.Game(started_at)
 
     logging.info('Running game')
 
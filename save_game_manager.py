@@ -1,32 +1,213 @@
+import randomizers
+import tetriminos
 import logging
+import storage
 import pickle
+import struct
+import io
 import os
 
+# A save file is made of this header followed by the queue of upcoming
+# Tetriminos and the bag of the randomizer (one byte per Tetrimino, being the
+# index of its class in tetriminos.__all__), then the playground: one byte per
+# cell, row by row, being 0 for an empty cell or the index of the Tetrimino
+# class the block came from plus one.
+MAGIC = b'TTRS'
+VERSION = 1
 
-def load_game(filename, obj, attrs):
-    """Load a saved game."""
+HEADER = struct.Struct(
+    '<' # Little-endian, no padding
+    '4s' # Magic
+    'B' # Version
+    'HH' # Playground columns and rows
+    'IIQII' # Level, lines, score, duration and placed Tetriminos count
+    'I' # Applied actions count, which is also the number of events of the replay of the game (see replay_manager)
+    'BBhh' # Current Tetrimino class index, rotation and position
+    'BQQ' # Randomizer index (in randomizers.RANDOMIZERS), seed and state
+    'BB' # Length of the queue and of the bag of the randomizer
+)
+
+UNKNOWN_ACTIONS = 0xFFFFFFFF # The applied actions count of games migrated from a legacy save file
+
+COLORS = [None] + [getattr(tetriminos, name).background_color for name in tetriminos.__all__]
+COLORS_INDEXES = {color: index for index, color in enumerate(COLORS)}
+
+
+def load_game(filename, engine):
+    """Load a saved game. Return whether the game was loaded."""
     if not os.path.isfile(filename):
         logging.info('Save file does not exists')
-        return
+        return False
 
     logging.info('Loading saved game')
 
     with open(filename, 'rb') as f:
-        data = pickle.load(f)
+        data = f.read()
+
+    if not data.startswith(MAGIC):
+        return _load_legacy_game(data, engine)
+
+    try:
+        magic, version, cols, rows, level, lines, score, duration, pieces, actions, current_tetrimino, rotation, x, y, randomizer, seed, state, queue_length, bag_length = HEADER.unpack_from(data)
+    except struct.error as e:
+        logging.warning('Invalid save file: {}'.format(e))
+        return False
+
+    if version != VERSION:
+        logging.warning('Unsupported save file version {}'.format(version))
+        return False
+
+    offset = HEADER.size + queue_length + bag_length
+
+    queue = list(data[HEADER.size:HEADER.size + queue_length])
+    bag = list(data[HEADER.size + queue_length:offset])
+
+    if actions == UNKNOWN_ACTIONS:
+        actions = None
+
+    if (cols, rows) != (engine.playground.cols, engine.playground.rows):
+        logging.warning('Saved game playground size ({}x{}) does not match the current one'.format(cols, rows))
+        return False
+
+    if len(data) != offset + cols * rows:
+        logging.warning('Invalid save file: truncated playground')
+        return False
+
+    if randomizer >= len(randomizers.RANDOMIZERS) or any(index >= len(tetriminos.__all__) for index in queue + bag):
+        logging.warning('Invalid save file: unknown randomizer state')
+        return False
+
+    if current_tetrimino >= len(tetriminos.__all__) or rotation >= len(getattr(tetriminos, tetriminos.__all__[current_tetrimino]).rotations):
+        logging.warning('Invalid save file: unknown current Tetrimino')
+        return False
+
+    rotation_state = getattr(tetriminos, tetriminos.__all__[current_tetrimino]).rotations[rotation]
+
+    if not (0 <= x <= cols - rotation_state.width and 0 <= y <= rows - rotation_state.height):
+        logging.warning('Invalid save file: current Tetrimino outside of the playground')
+        return False
+
+    if any(index >= len(COLORS) for index in data[offset:]):
+        logging.warning('Invalid save file: unknown block in the playground')
+        return False
+
+    engine.playground.set_colors([COLORS[index] for index in data[offset:]])
+
+    engine.level = level
+    engine.lines = lines
+    engine.score = score
+    engine.duration = duration
+    engine.pieces = pieces
+    engine.actions = actions
+    engine.current_tetrimino = getattr(tetriminos, tetriminos.__all__[current_tetrimino])(x, y, rotation)
+
+    engine.randomizer = randomizers.RANDOMIZERS[randomizer](engine.randomizer.lookahead)
+    engine.randomizer.set_state(seed, state, queue, bag)
+    engine.next_tetrimino = getattr(tetriminos, tetriminos.__all__[engine.randomizer.peek()])
+
+    engine.is_game_over = False
+
+    return True
 
-    for attr in attrs:
-        if attr in data:
-            setattr(obj, attr, data[attr])
 
+def get_snapshot(engine):
+    """Return a copy of everything needed to save the current game, cheap enough to be taken on every frame."""
+    current_tetrimino = engine.current_tetrimino
+    seed, state, queue, bag = engine.randomizer.get_state()
 
-def save_game(filename, obj, attrs):
+    return (
+        engine.playground.cols,
+        engine.playground.rows,
+        engine.level,
+        engine.lines,
+        engine.score,
+        engine.duration,
+        engine.pieces,
+        UNKNOWN_ACTIONS if engine.actions is None else engine.actions,
+        tetriminos.__all__.index(current_tetrimino.__class__.__name__),
+        current_tetrimino.rotation,
+        current_tetrimino.x,
+        current_tetrimino.y,
+        randomizers.RANDOMIZERS.index(engine.randomizer.__class__),
+        seed,
+        state,
+        queue,
+        bag,
+        engine.playground.colors.copy()
+    )
+
+
+def dump_snapshot(snapshot):
+    """Return the content of the save file of the given game snapshot."""
+    queue, bag, colors = snapshot[-3:]
+
+    return HEADER.pack(MAGIC, VERSION, *snapshot[:-3], len(queue), len(bag)) + bytes(queue) + bytes(bag) + bytes(map(COLORS_INDEXES.__getitem__, colors))
+
+
+def save_game(filename, engine):
     """Save the current game."""
     logging.info('Saving current game')
 
-    data = {}
+    storage.write_atomically(filename, dump_snapshot(get_snapshot(engine)))
+
+
+def _restore_next_tetrimino(engine, next_tetrimino):
+    """Restart the randomizer of a game saved by a previous version, which only knew about the next Tetrimino.
+
+    Its first upcoming Tetrimino is replaced by the saved one."""
+    engine.randomizer.reset()
+    engine.randomizer.queue[0] = next_tetrimino
+    engine.next_tetrimino = getattr(tetriminos, tetriminos.__all__[next_tetrimino])
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """Unpickler only allowing the classes that were stored in the pickled save files of previous versions."""
+
+    def find_class(self, module, name):
+        if module == 'tetriminos' and (name == 'Block' or name in tetriminos.__all__):
+            return getattr(tetriminos, name)
+
+        raise pickle.UnpicklingError('Forbidden class {}.{} in save file'.format(module, name))
+
+
+def _load_legacy_game(data, engine):
+    """Load a game saved by a previous version, which pickled the game attributes (the fallen blocks being a list of Block objects)."""
+    logging.info('Migrating legacy save file')
+
+    cols = engine.playground.cols
+    rows = engine.playground.rows
+
+    # The state is read before anything is restored, so a truncated or edited save file leaves the engine untouched
+    try:
+        data = _LegacyUnpickler(io.BytesIO(data)).load()
+
+        colors = [None] * (cols * rows)
+
+        for block in data['fallen_blocks']:
+            if not (0 <= block.x < cols and 0 <= block.y < rows):
+                raise ValueError('block outside of the {}x{} playground'.format(cols, rows))
+
+            colors[block.y * cols + block.x] = block.background_color
+
+        level, lines, score, duration = data['level'], data['lines'], data['score'], data['duration']
+        current_tetrimino = data['current_tetrimino']
+        current_tetrimino = current_tetrimino.__class__(current_tetrimino.x, current_tetrimino.y, current_tetrimino.rotation)
+        next_tetrimino = tetriminos.__all__.index(data['next_tetrimino'].__name__)
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, KeyError, TypeError, ValueError, IndexError) as e:
+        logging.warning('Invalid save file: {}'.format(e))
+        return False
+
+    engine.playground.set_colors(colors)
+
+    engine.level = level
+    engine.lines = lines
+    engine.score = score
+    engine.duration = duration
+    engine.pieces = 0
+    engine.actions = None
+    engine.current_tetrimino = current_tetrimino
 
-    for attr in attrs:
-        data[attr] = getattr(obj, attr)
+    _restore_next_tetrimino(engine, next_tetrimino)
+    engine.is_game_over = False
 
-    with open(filename, 'wb') as f:
-        pickle.dump(data, f)
+    return True
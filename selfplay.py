@@ -0,0 +1,245 @@
+"""Let the autoplayer play many games at once, spread across processes, and
+summarize how they went.
+
+Games are played by the same logic as in the window (gravity, levels and the
+pace of the autoplayer are applied on every logic tick), only without any
+window and as fast as possible. Game i is played from the seed --seed + i, so
+runs are reproducible.
+
+Autoplayer weights (see autoplayer.WEIGHTS) and settings can be swept: every
+combination of the given values plays the same seeds, so they can be compared.
+Sweeping COLS, ROWS or RANDOMIZER overrides --cols, --rows or --randomizer:
+
+    python selfplay.py --games 1000 --sweep holes=-0.3,-0.4 LEVEL_INCREASE_LINES_STEP=8,16
+"""
+import multiprocessing
+import randomizers
+import autoplayer
+import statistics
+import itertools
+import argparse
+import settings
+import logging
+import helpers
+import engine
+import json
+import game
+import time
+import os
+
+
+class SelfPlayGame(game.Game):
+    """The game logic alone, only played by the autoplayer, as fast as possible."""
+
+    def __init__(self, seed, cols=settings.COLS, rows=settings.ROWS, randomizer=settings.RANDOMIZER, weights=None):
+        self._init_logic_state(engine.Engine(cols, rows, randomizers.get_randomizer(randomizer, settings.LOOKAHEAD)))
+
+        self.engine.new_game(seed)
+
+        self.autoplayer = autoplayer.Autoplayer(weights)
+
+    def play(self, max_pieces=None):
+        """Run logic ticks until the game is over or max_pieces are placed."""
+        while self.state == settings.GameState.PLAYING and (max_pieces is None or self.engine.pieces < max_pieces):
+            self._tick()
+
+            self.dirty_cells.clear()
+
+    def _process_engine_events(self, events):
+        if 'game_over' in events:
+            self.state = settings.GameState.GAME_OVER
+
+
+def play_game(task):
+    """Play the game described by the given task. Run in the worker processes.
+
+    The settings of the task are applied beforehand, as worker processes may
+    not inherit the ones of the main process."""
+    for name, value in task['settings'].items():
+        setattr(settings, name, value)
+
+    started_at = time.perf_counter()
+
+    selfplay_game = SelfPlayGame(task['seed'], task['cols'], task['rows'], task['randomizer'], task['weights'])
+    selfplay_game.play(task['max_pieces'])
+
+    return {
+        'configuration': task['configuration'],
+        'seed': task['seed'],
+        'score': selfplay_game.engine.score,
+        'lines': selfplay_game.engine.lines,
+        'level': selfplay_game.engine.level,
+        'pieces': selfplay_game.engine.pieces,
+        'ticks': selfplay_game.ticks,
+        'is_game_over': selfplay_game.engine.is_game_over,
+        'seconds': time.perf_counter() - started_at
+    }
+
+
+def parse_setting_value(value, value_type):
+    """Convert the given string to a value of the given setting type. Booleans are written "true" or "false"."""
+    if value_type is bool:
+        if value.lower() not in ('true', 'false'):
+            raise ValueError('"{}" is neither true nor false'.format(value))
+
+        return value.lower() == 'true'
+
+    return value_type(value)
+
+
+def parse_sweep(value):
+    """Parse a NAME=VALUE,VALUE... sweep argument, NAME being an autoplayer weight or a setting. Return the name along the list of values."""
+    name, _, values = value.partition('=')
+
+    if name in autoplayer.WEIGHTS:
+        value_type = float
+    elif name.isupper() and hasattr(settings, name):
+        value_type = type(getattr(settings, name))
+    else:
+        raise argparse.ArgumentTypeError('"{}" is neither an autoplayer weight nor a setting'.format(name))
+
+    if value_type not in (int, float, str, bool):
+        raise argparse.ArgumentTypeError('The {} setting can\'t be swept, only numbers, strings and booleans can'.format(name))
+
+    try:
+        values = [parse_setting_value(value, value_type) for value in values.split(',')]
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+    if name == 'RANDOMIZER':
+        for value in values:
+            if value not in [randomizer.name for randomizer in randomizers.RANDOMIZERS]:
+                raise argparse.ArgumentTypeError('Unknown randomizer "{}"'.format(value))
+    elif name in ('COLS', 'ROWS') and min(values) < 4:
+        raise argparse.ArgumentTypeError('The playground must be at least 4 blocks wide and high')
+
+    return name, values
+
+
+def get_configurations(sweeps):
+    """Return every combination of the values of the given (name, values) sweeps, as (weights, settings) dicts tuples."""
+    configurations = []
+
+    for values in itertools.product(*[values for name, values in sweeps]):
+        weights = {}
+        settings_values = {}
+
+        for (name, _), value in zip(sweeps, values):
+            if name in autoplayer.WEIGHTS:
+                weights[name] = value
+            else:
+                settings_values[name] = value
+
+        configurations.append((weights, settings_values))
+
+    return configurations
+
+
+def get_tasks(configurations, games, seed, cols, rows, randomizer, max_pieces):
+    """Return the games to be played: the same seeds for each configuration.
+
+    The playground size and the randomizer are given to the games themselves
+    rather than read from the settings, so sweeping them replaces the given
+    ones."""
+    return [
+        {
+            'configuration': index,
+            'seed': seed + i,
+            'weights': weights,
+            'settings': settings_values,
+            'cols': settings_values.get('COLS', cols),
+            'rows': settings_values.get('ROWS', rows),
+            'randomizer': settings_values.get('RANDOMIZER', randomizer),
+            'max_pieces': max_pieces
+        }
+        for index, (weights, settings_values) in enumerate(configurations) for i in range(0, games)
+    ]
+
+
+def summarize(results):
+    """Return the figures of the given games results."""
+    scores = [result['score'] for result in results]
+
+    return {
+        'games': len(results),
+        'games_over': sum(result['is_game_over'] for result in results),
+        'mean_score': statistics.mean(scores),
+        'median_score': statistics.median(scores),
+        'min_score': min(scores),
+        'max_score': max(scores),
+        'mean_lines': statistics.mean(result['lines'] for result in results),
+        'mean_pieces': statistics.mean(result['pieces'] for result in results),
+        'mean_ticks': statistics.mean(result['ticks'] for result in results)
+    }
+
+
+def run():
+    parser = argparse.ArgumentParser(description='Let the autoplayer play many games across processes and summarize them.')
+    parser.add_argument('--games', type=int, default=100, help='Number of games to play for each configuration')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the first game, the next ones being played from the next seeds')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=1, help='Number of games sent to a worker process at once')
+    parser.add_argument('--max-pieces', type=int, default=1000, help='Stop games after this number of placed Tetriminos')
+    parser.add_argument('--cols', type=int, default=settings.COLS)
+    parser.add_argument('--rows', type=int, default=settings.ROWS)
+    parser.add_argument('--randomizer', default=settings.RANDOMIZER, choices=[randomizer.name for randomizer in randomizers.RANDOMIZERS])
+    parser.add_argument('--sweep', type=parse_sweep, nargs='*', default=[], help='Values to try for an autoplayer weight or a setting, as NAME=VALUE,VALUE...')
+    parser.add_argument('--output', help='JSON file to write the results of every game and the summaries to')
+
+    args = parser.parse_args()
+
+    helpers.configure_logging()
+
+    configurations = get_configurations(args.sweep)
+    tasks = get_tasks(configurations, args.games, args.seed, args.cols, args.rows, args.randomizer, args.max_pieces)
+
+    logging.info('Playing {} games on {} processes'.format(len(tasks), args.processes))
+
+    started_at = time.perf_counter()
+
+    with multiprocessing.Pool(args.processes) as pool:
+        results = list(pool.imap_unordered(play_game, tasks, args.chunk_size))
+
+    elapsed = time.perf_counter() - started_at
+
+    # Games end in any order
+    results.sort(key=lambda result: (result['configuration'], result['seed']))
+
+    summaries = []
+
+    for index, (weights, settings_values) in enumerate(configurations):
+        summary = summarize([result for result in results if result['configuration'] == index])
+        summary['weights'] = weights
+        summary['settings'] = settings_values
+
+        summaries.append(summary)
+
+        logging.info('{}: mean score {:.1f}, median {}, min {}, max {}, {:.1f} lines, {:.1f} pieces, {:.0f} ticks, {}/{} games over'.format(
+            ', '.join('{}={}'.format(name, value) for name, value in sorted(dict(weights, **settings_values).items())) or 'Defaults',
+            summary['mean_score'],
+            summary['median_score'],
+            summary['min_score'],
+            summary['max_score'],
+            summary['mean_lines'],
+            summary['mean_pieces'],
+            summary['mean_ticks'],
+            summary['games_over'],
+            summary['games']
+        ))
+
+    logging.info('{} games played in {:.2f} seconds ({:.1f} games per second, {:.0f} pieces per second)'.format(
+        len(results),
+        elapsed,
+        len(results) / elapsed,
+        sum(result['pieces'] for result in results) / elapsed
+    ))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'summaries': summaries, 'results': results}, f, indent=2)
+
+        logging.info('Results written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    run()
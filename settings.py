@@ -1,5 +1,3 @@
-import pygame
-import math
 import sys
 import os
 
@@ -7,18 +5,47 @@ import os
 # Editable settings
 
 FPS = 30
+TICK_RATE = 240 # Number of times per second the inputs are handled and the Tetrimino falls, regardless of the FPS
 BLOCKS_SIDE_SIZE = 20
 SAVE_FILE_NAME = 'save.dat'
 STATS_FILE_NAME = 'stats.json'
+HISTORY_FILE_NAME = 'history.dat'
+STATS_ROLLING_WINDOW = 100 # Number of latest games the average score is computed on
+RECORD_REPLAYS = True # Record the actions of every game so it can be replayed and checked later (see replay.py)
+REPLAYS_DIRECTORY = 'replays'
+AUTOSAVE_INTERVAL = 10 # Minimum number of seconds between two automatic saves of the current game (0 to disable)
 TETRIMINOS_INITIAL_FALLING_INTERVAL = 1000
 TETRIMINOS_FALLING_INTERVAL_DECREASE_STEP = 100
 TETRIMINOS_FAST_FALLING_INTERVAL = 50
+AUTO_REPEAT_DELAY = 170 # Number of milliseconds the left or right key has to be held before the Tetrimino starts moving repeatedly
+AUTO_REPEAT_INTERVAL = 50 # Number of milliseconds between each repeated move (0 to move the Tetrimino as far as possible at once)
 LEVEL_INCREASE_LINES_STEP = 8
 COMPLETED_LINE_SCORE = 10
+RANDOMIZER = 'uniform' # How the Tetriminos are chosen: "uniform" (any one at any time) or "bag" (each one once in every 7)
+LOOKAHEAD = 5 # Number of upcoming Tetriminos generated in advance
+AUTOPLAYER = False # Let the computer play at startup (toggled by F4)
+AUTOPLAYER_INTERVAL = 50 # Number of milliseconds between each action of the autoplayer (0 to move the Tetrimino at once)
 
 COLS = 12
 ROWS = 30
 
+# Playgrounds which wouldn't fit in this size (in pixels) are drawn with smaller blocks and without grid (e.g. 200 x 400)
+MAX_PLAYGROUND_SIZE = (1200, 900)
+
+# Only redraw and update the parts of the window which changed since the previous frame
+DIRTY_RECTS_RENDERING = True
+
+SHOW_GHOST = True # Show where the falling Tetrimino would land
+GHOST_OPACITY = 0.3
+
+PROFILER = False # Measure the time spent in each phase of the frames and display it at startup (toggled by F3)
+PROFILER_WINDOW = 300 # Number of latest frames the displayed times are computed on
+PROFILER_FILE_NAME = None # If set (e.g. 'frames.csv'), the times of every measured frame are appended to this CSV file
+
+SPECTATOR_SERVER = False # Let spectators follow the game over the network (see spectator.py)
+SPECTATOR_ADDRESS = ('127.0.0.1', 7777) # Use '0.0.0.0' as host to accept spectators from other computers
+SPECTATOR_QUEUE_SIZE = 256 # Number of messages a spectator can be late by before being sent a snapshot instead
+
 DRAW_GRID = True
 GRID_SPACING = 1
 GRID_COLOR = (255, 255, 255)
@@ -36,9 +63,6 @@ SOUNDS_VOLUME = 0.3
 # When frozen by PyInstaller, the path to the resources is different
 RESOURCES_ROOT = os.path.join(sys._MEIPASS, 'resources') if getattr(sys, 'frozen', False) else 'resources'
 
-TETRIMINOS_FALLING_EVENT = pygame.USEREVENT + 1
-GAME_DURATION_EVENT = pygame.USEREVENT + 2
-
 
 class GameState:
     PLAYING = 2
@@ -48,9 +72,26 @@ class GameState:
 
 INFO_PANEL_WIDTH = 150
 
-PLAYGROUND_WIDTH = COLS * BLOCKS_SIDE_SIZE + (COLS - 1) * GRID_SPACING
-PLAYGROUND_HEIGHT = ROWS * BLOCKS_SIDE_SIZE + (ROWS - 1) * GRID_SPACING
-PLAYGROUND_CENTERX = math.floor((COLS - 1) / 2)
+TEXT_CACHE_SIZE = 64 # Maximum number of rendered texts kept in memory
+
+MAX_LOGIC_LAG = 0.25 # Maximum number of seconds of logic ticks run at once, e.g. after the game was stalled
+
+
+# The geometry of the playground is computed from the editable settings above, and isn't meant to be edited either
+# (benchmark.py calls this function again after changing COLS and ROWS)
+def get_playground_geometry(cols, rows):
+    """Return the side size of the blocks of the playground, the spacing between them and the size of the playground, for the given number of columns and rows."""
+    blocks_side_size = BLOCKS_SIDE_SIZE
+    grid_spacing = GRID_SPACING
+
+    if cols * (blocks_side_size + grid_spacing) - grid_spacing > MAX_PLAYGROUND_SIZE[0] or rows * (blocks_side_size + grid_spacing) - grid_spacing > MAX_PLAYGROUND_SIZE[1]:
+        blocks_side_size = max(1, min(MAX_PLAYGROUND_SIZE[0] // cols, MAX_PLAYGROUND_SIZE[1] // rows))
+        grid_spacing = 0
+
+    return blocks_side_size, grid_spacing, (cols * blocks_side_size + (cols - 1) * grid_spacing, rows * blocks_side_size + (rows - 1) * grid_spacing)
+
+
+PLAYGROUND_BLOCKS_SIDE_SIZE, PLAYGROUND_GRID_SPACING, (PLAYGROUND_WIDTH, PLAYGROUND_HEIGHT) = get_playground_geometry(COLS, ROWS)
 
 WINDOW_SIZE = (
     PLAYGROUND_WIDTH + INFO_PANEL_WIDTH,
@@ -0,0 +1,367 @@
+"""Let spectators follow a game over the network.
+
+The game publishes what changes (the falling Tetrimino, placed Tetriminos,
+removed rows, score...) to a server running its own asyncio event loop in a
+background thread, which broadcasts these deltas to every connected spectator
+as JSON lines. A copy of the playground is maintained by the server from the
+deltas, so spectators joining in the middle of a game are first sent a
+snapshot of it, without involving the game.
+
+Every spectator has a bounded queue of messages: when a spectator can't keep
+up, its queue is emptied and the next messages are dropped until it can be
+sent a fresh snapshot, so neither the game nor the other spectators ever wait
+for it.
+
+Run this module to follow a game (see settings.SPECTATOR_SERVER) in a
+terminal:
+
+    python spectator.py --host 127.0.0.1 --port 7777
+"""
+import save_game_manager
+import tetriminos
+import threading
+import argparse
+import settings
+import logging
+import asyncio
+import json
+import time
+import sys
+
+# Cells of the playground are sent as one character each: "0" for empty cells, otherwise "1" to "7" for the Tetrimino
+# classes (see save_game_manager.COLORS)
+CELLS_CHARACTERS = bytes.maketrans(bytes(range(0, 8)), b'01234567')
+
+# How cells are displayed in the terminal: fallen blocks in upper case, the falling Tetrimino in lower case
+DISPLAYED_CHARACTERS = bytes.maketrans(b'01234567', b'.IJLOSTZ')
+FALLING_CHARACTERS = 'ijlostz'
+
+
+def get_kind(tetrimino):
+    """Return the index of the class of the given Tetrimino in tetriminos.__all__."""
+    return tetriminos.__all__.index(tetrimino.__class__.__name__)
+
+
+def get_snapshot_message(engine):
+    """Return the message describing the whole game of the given engine."""
+    return dict(
+        get_infos_message(engine),
+        t='snapshot',
+        cols=engine.playground.cols,
+        rows=engine.playground.rows,
+        board=bytes(map(save_game_manager.COLORS_INDEXES.__getitem__, engine.playground.colors)).translate(CELLS_CHARACTERS).decode('ascii'),
+        tetrimino=None if engine.is_game_over else get_tetrimino_message(engine.current_tetrimino),
+        game_over=engine.is_game_over
+    )
+
+
+def get_tetrimino_message(tetrimino):
+    """Return the message telling where the falling Tetrimino is."""
+    return {'t': 'tetrimino', 'kind': get_kind(tetrimino), 'cells': [[block.x, block.y] for block in tetrimino.blocks]}
+
+
+def get_place_message(tetrimino):
+    """Return the message telling the given Tetrimino was placed where it is."""
+    return {'t': 'place', 'kind': get_kind(tetrimino), 'cells': [[block.x, block.y] for block in tetrimino.blocks]}
+
+
+def get_remove_message(rows):
+    """Return the message telling the given rows were removed, making everything above them to fall."""
+    return {'t': 'remove', 'rows': rows}
+
+
+def get_infos_message(engine):
+    """Return the message giving the values displayed in the information panel."""
+    return {
+        't': 'infos',
+        'score': engine.score,
+        'lines': engine.lines,
+        'level': engine.level,
+        'next': tetriminos.__all__.index(engine.next_tetrimino.__name__)
+    }
+
+
+def get_game_over_message():
+    """Return the message telling the game is over."""
+    return {'t': 'game_over'}
+
+
+class Board:
+    """A copy of a game, only maintained from the messages."""
+
+    def __init__(self):
+        self.cols = 0
+        self.rows = 0
+        self.cells = bytearray()
+        self.tetrimino = None
+        self.infos = {'score': 0, 'lines': 0, 'level': 1, 'next': 0}
+        self.is_game_over = False
+
+    def apply(self, message):
+        """Update the board according to the given message."""
+        message_type = message['t']
+
+        if message_type == 'snapshot':
+            self.cols = message['cols']
+            self.rows = message['rows']
+            self.cells = bytearray(message['board'].encode('ascii'))
+            self.tetrimino = message['tetrimino']
+            self.infos = {name: message[name] for name in self.infos}
+            self.is_game_over = message['game_over']
+        elif message_type == 'tetrimino':
+            self.tetrimino = message
+        elif message_type == 'place':
+            character = ord(str(message['kind'] + 1))
+
+            for x, y in message['cells']:
+                self.cells[y * self.cols + x] = character
+        elif message_type == 'remove':
+            removed = set(message['rows'])
+            kept = [self.cells[y * self.cols:(y + 1) * self.cols] for y in range(0, self.rows) if y not in removed]
+
+            self.cells = bytearray(b'0' * (len(removed) * self.cols)) + b''.join(kept)
+        elif message_type == 'infos':
+            self.infos = {name: message[name] for name in self.infos}
+        elif message_type == 'game_over':
+            self.tetrimino = None
+            self.is_game_over = True
+
+    def get_snapshot(self):
+        """Return the message describing the whole board."""
+        return dict(
+            self.infos,
+            t='snapshot',
+            cols=self.cols,
+            rows=self.rows,
+            board=self.cells.decode('ascii'),
+            tetrimino=self.tetrimino,
+            game_over=self.is_game_over
+        )
+
+    def render(self):
+        """Return the board as text, one line per row."""
+        cells = self.cells.translate(DISPLAYED_CHARACTERS)
+
+        if self.tetrimino:
+            for x, y in self.tetrimino['cells']:
+                cells[y * self.cols + x] = ord(FALLING_CHARACTERS[self.tetrimino['kind']])
+
+        return '\n'.join(cells[y * self.cols:(y + 1) * self.cols].decode('ascii') for y in range(0, self.rows))
+
+
+def encode(message):
+    """Return the given message as a JSON line."""
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode('ascii')
+
+
+class SpectatorClient:
+    """A connected spectator, along the queue of the messages it still has to be sent.
+
+    A None item in the queue stands for a snapshot of the board, which is only
+    made once it's its turn to be sent."""
+
+    def __init__(self, writer, queue_size):
+        self.writer = writer
+        self.queue = asyncio.Queue(queue_size)
+        self.queue.put_nowait(None) # Spectators are first sent the whole board
+        self.is_late = True # Whether messages are dropped until the snapshot is sent
+        self.task = asyncio.current_task()
+        self.resyncs = 0 # Number of times it was too late and had to be sent a snapshot
+
+    def send(self, data):
+        """Queue the given encoded message. If the spectator is too late, every message it missed is replaced by a snapshot."""
+        if self.is_late:
+            return
+
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+
+            self.queue.put_nowait(None)
+
+            self.is_late = True
+            self.resyncs += 1
+
+
+class SpectatorServer:
+    """Broadcast the messages published by the game to the spectators, from a background thread."""
+
+    def __init__(self, host, port, queue_size=settings.SPECTATOR_QUEUE_SIZE):
+        """A port of 0 makes the server to listen on any free port, available in the address attribute once started."""
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.board = Board()
+        self.clients = set()
+        self.loop = None
+        self.server = None
+        self.address = None
+        self.error = None
+        self.started = threading.Event()
+        self.is_stopped_logged = False
+
+    def start(self):
+        """Start listening for spectators. Return once it's done, raising any error which prevented it."""
+        threading.Thread(target=self._run, name='SpectatorServer', daemon=True).start()
+
+        self.started.wait()
+
+        if self.error:
+            raise self.error
+
+    def close(self):
+        """Disconnect the spectators and stop listening."""
+        if self.loop and self.server:
+            self.loop.call_soon_threadsafe(self.server.close)
+
+    def publish(self, message):
+        """Broadcast the given message to the spectators. Called from the game thread, only queuing the message to the server thread.
+
+        Messages are dropped once the server is stopped (e.g. its thread died),
+        so the game goes on without spectators."""
+        if self.loop is None or self.loop.is_closed():
+            self._log_stopped()
+
+            return
+
+        try:
+            self.loop.call_soon_threadsafe(self._broadcast, message)
+        except RuntimeError: # The loop was closed in the meantime
+            self._log_stopped()
+
+    def _log_stopped(self):
+        if not self.is_stopped_logged:
+            logging.warning('Spectator server stopped, not broadcasting the game anymore')
+
+            self.is_stopped_logged = True
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+
+        try:
+            self.loop.run_until_complete(self._serve())
+        except Exception as e:
+            if self.started.is_set():
+                logging.exception('Spectator server error')
+
+            self.error = e
+        finally:
+            self.started.set()
+
+            self.loop.close()
+
+    async def _serve(self):
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.address = self.server.sockets[0].getsockname()[:2]
+
+        logging.info('Spectators can connect to {}:{}'.format(*self.address))
+
+        self.started.set()
+
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+        tasks = [client.task for client in self.clients]
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _broadcast(self, message):
+        self.board.apply(message)
+
+        if not self.clients:
+            return
+
+        data = encode(message)
+
+        for client in self.clients:
+            client.send(data)
+
+    async def _handle_client(self, reader, writer):
+        client = SpectatorClient(writer, self.queue_size)
+
+        self.clients.add(client)
+
+        logging.info('Spectator connected from {}:{}'.format(*writer.get_extra_info('peername')[:2]))
+
+        try:
+            while True:
+                # Every queued message is sent at once
+                messages = [await client.queue.get()]
+
+                while not client.queue.empty():
+                    messages.append(client.queue.get_nowait())
+
+                if messages[-1] is None: # Nothing is queued along a snapshot
+                    messages = [encode(self.board.get_snapshot())]
+
+                    client.is_late = False
+
+                writer.write(b''.join(messages))
+
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.clients.discard(client)
+
+            writer.close()
+
+            logging.info('Spectator disconnected ({} resyncs)'.format(client.resyncs))
+
+
+async def follow(host, port):
+    """Connect to a spectator server and yield the messages it sends."""
+    reader, writer = await asyncio.open_connection(host, port)
+
+    try:
+        while True:
+            line = await reader.readline()
+
+            if not line:
+                return
+
+            yield json.loads(line)
+    finally:
+        writer.close()
+
+
+async def watch(host, port, fps):
+    """Display the game followed from a spectator server in the terminal."""
+    board = Board()
+    displayed_at = 0
+
+    async for message in follow(host, port):
+        board.apply(message)
+
+        if time.monotonic() - displayed_at < 1 / fps:
+            continue
+
+        displayed_at = time.monotonic()
+
+        sys.stdout.write('\x1b[H\x1b[2J{}\nScore {score}  Lines {lines}  Level {level}{}\n'.format(board.render(), '  Game over' if board.is_game_over else '', **board.infos))
+        sys.stdout.flush()
+
+
+def run():
+    parser = argparse.ArgumentParser(description='Follow a game in the terminal.')
+    parser.add_argument('--host', default=settings.SPECTATOR_ADDRESS[0])
+    parser.add_argument('--port', type=int, default=settings.SPECTATOR_ADDRESS[1])
+    parser.add_argument('--fps', type=int, default=10, help='Maximum number of times per second the game is displayed')
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(watch(args.host, args.port, args.fps))
+    except (KeyboardInterrupt, ConnectionError):
+        pass
+
+
+if __name__ == '__main__':
+    run()
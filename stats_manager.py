@@ -1,31 +1,239 @@
+from collections import namedtuple, deque
 import logging
+import storage
+import bisect
+import struct
 import json
 import os
 
+# Every finished game is appended to the history file as one of these fixed-size records
+HISTORY_RECORD = struct.Struct(
+    '<' # Little-endian, no padding
+    'd' # Timestamp
+    'Q' # Score
+    'IIII' # Lines, level, duration and placed Tetriminos count
+)
 
-def load_stats(filename, stats_dict):
-    """Save the current stats to a JSON file."""
-    if not os.path.isfile(filename):
+HistoryRecord = namedtuple('HistoryRecord', ['timestamp', 'score', 'lines', 'level', 'duration', 'pieces'])
+
+
+def load_stats(filename, stats_dict, history_filename=None):
+    """Load stats from a JSON file.
+
+    Estimators which state couldn't be found in this file (e.g. the file was
+    written by a previous version) are fed with the games history instead, if
+    its file name is given. A partially written record at the end of the
+    history file is removed, so the next ones are appended where they belong."""
+    if history_filename:
+        repair_history(history_filename)
+
+    if os.path.isfile(filename):
+        logging.info('Loading stats')
+
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        estimators = data.pop('estimators', {})
+
+        for key, value in data.items():
+            if key in stats_dict:
+                stats_dict[key]['value'] = value
+
+        for key, state in estimators.items():
+            if key in stats_dict and 'estimator' in stats_dict[key]:
+                stats_dict[key]['estimator'].set_state(state)
+    else:
         logging.info('Stats file does not exists')
+
+        estimators = {}
+
+    missing = [stat for key, stat in stats_dict.items() if 'estimator' in stat and key not in estimators]
+
+    if not missing or not history_filename:
         return
 
-    logging.info('Loading stats')
+    logging.info('Rebuilding stats from the games history')
 
-    with open(filename, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    for record in read_history(history_filename):
+        for stat in missing:
+            stat['estimator'].add(getattr(record, stat['field']))
 
-        for key, value in data.items():
-            stats_dict[key]['value'] = value
+    for stat in missing:
+        stat['value'] = round(stat['estimator'].get())
+
+
+def get_snapshot(stats_dict):
+    """Return a copy of the current stats values, along the state of their estimators."""
+    snapshot = {key: stat['value'] for key, stat in stats_dict.items()}
+
+    snapshot['estimators'] = {key: stat['estimator'].get_state() for key, stat in stats_dict.items() if 'estimator' in stat}
+
+    return snapshot
+
+
+def dump_snapshot(snapshot):
+    """Return the content of the stats file of the given stats snapshot."""
+    return json.dumps(snapshot)
 
 
 def save_stats(filename, stats_dict):
-    """Load stats from a JSON file."""
+    """Save the current stats to a JSON file."""
     logging.info('Saving stats')
 
-    data = {}
+    storage.write_atomically(filename, dump_snapshot(get_snapshot(stats_dict)))
+
+
+def get_history_record(engine, timestamp):
+    """Return the history record of the game of the given engine."""
+    return HistoryRecord(timestamp, engine.score, engine.lines, engine.level, engine.duration, engine.pieces)
+
+
+def dump_history_record(record):
+    """Return the bytes to append to the history file for the given record."""
+    return HISTORY_RECORD.pack(*record)
+
+
+def repair_history(filename):
+    """Remove the partially written record at the end of the history file, if any (e.g. the game was killed while appending it)."""
+    if not os.path.isfile(filename):
+        return
+
+    size = os.path.getsize(filename)
+    extra = size % HISTORY_RECORD.size
+
+    if extra:
+        logging.warning('Removing a partially written record from the games history')
+
+        storage.truncate(filename, size - extra)
+
+
+def read_history(filename):
+    """Iterate over the records of the history file, oldest first.
+
+    A partially written record at the end of the file (e.g. the game was killed
+    while appending it) is ignored."""
+    if not os.path.isfile(filename):
+        return
+
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(HISTORY_RECORD.size)
+
+            if len(data) < HISTORY_RECORD.size:
+                return
+
+            yield HistoryRecord(*HISTORY_RECORD.unpack(data))
+
+
+class RollingMean:
+    """The mean of the latest values (at most size of them), updated in O(1) for each new value."""
+
+    def __init__(self, size):
+        self.values = deque(maxlen=size)
+        self.total = 0
+
+    def add(self, value):
+        if len(self.values) == self.values.maxlen:
+            self.total -= self.values[0]
+
+        self.values.append(value)
+        self.total += value
+
+    def get(self):
+        return self.total / len(self.values) if self.values else 0
+
+    def get_state(self):
+        return list(self.values)
+
+    def set_state(self, state):
+        self.values.clear()
+        self.values.extend(state)
+        self.total = sum(self.values)
+
+
+class StreamingQuantile:
+    """Estimate a quantile of an unbounded amount of values in constant memory and time.
+
+    This is the P² algorithm (Jain and Chlamtac, 1985): five markers are kept,
+    whose heights are adjusted with a piecewise-parabolic interpolation so the
+    middle one follows the wanted quantile. The value is exact until five values
+    were added."""
+
+    def __init__(self, quantile):
+        self.quantile = quantile
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+        self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def add(self, value):
+        heights = self.heights
+
+        if len(heights) < 5:
+            bisect.insort(heights, value)
+
+            return
+
+        positions = self.positions
+
+        # Find the cell the value falls in, extending the extreme markers if needed
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = bisect.bisect_right(heights, value, 1, 4) - 1
+
+        for i in range(k + 1, 5):
+            positions[i] += 1
+
+        for i in range(0, 5):
+            self.desired[i] += self.increments[i]
+
+        # Move the middle markers to their desired positions, if they are off by one or more
+        for i in range(1, 4):
+            d = self.desired[i] - positions[i]
+
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+
+                height = self._parabolic(i, d)
+
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+
+                heights[i] = height
+                positions[i] += d
+
+    def _parabolic(self, i, d):
+        """The piecewise-parabolic prediction of the height of the marker i moved by d."""
+        heights = self.heights
+        positions = self.positions
+
+        return heights[i] + d / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + d) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i]) +
+            (positions[i + 1] - positions[i] - d) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+        )
+
+    def get(self):
+        if not self.heights:
+            return 0
+
+        if len(self.heights) < 5:
+            return self.heights[round(self.quantile * (len(self.heights) - 1))]
+
+        return self.heights[2]
 
-    for key, stat in stats_dict.items():
-        data[key] = stat['value']
+    def get_state(self):
+        return {
+            'heights': self.heights.copy(),
+            'positions': self.positions.copy(),
+            'desired': self.desired.copy()
+        }
 
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f)
+    def set_state(self, state):
+        self.heights = list(state['heights'])
+        self.positions = list(state['positions'])
+        self.desired = list(state['desired'])
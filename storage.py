@@ -0,0 +1,117 @@
+import threading
+import logging
+import os
+
+
+def write_atomically(filename, data):
+    """Write bytes or a string to a file, which is either completely written or left untouched.
+
+    Data is first written to a temporary file next to the target one, which
+    then replaces it."""
+    temp_filename = filename + '.tmp'
+
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    try:
+        with open(temp_filename, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.isfile(temp_filename):
+            os.remove(temp_filename)
+
+        raise
+
+
+def truncate(filename, size):
+    """Cut the given file to the given size, if it exists and is longer."""
+    if os.path.isfile(filename) and os.path.getsize(filename) > size:
+        with open(filename, 'r+b') as f:
+            f.truncate(size)
+
+
+class BackgroundWriter:
+    """Serialize and write files atomically, or append to them, on a background thread.
+
+    Only the latest requested operation of each file is kept: if a file is
+    requested to be written again before the previous request was processed,
+    the previous one is simply dropped. Pending appends to the same file are
+    merged."""
+
+    def __init__(self):
+        self.pending = {}
+        self.is_busy = False
+        self.is_closing = False
+        self.condition = threading.Condition()
+
+        self.thread = threading.Thread(target=self._run, name='BackgroundWriter', daemon=True)
+        self.thread.start()
+
+    def write(self, filename, serializer, snapshot):
+        """Write to the given file the result of serializer(snapshot), which must be bytes or a string."""
+        with self.condition:
+            self.pending[filename] = ('write', serializer, snapshot)
+            self.condition.notify_all()
+
+    def append(self, filename, data):
+        """Append the given bytes to the given file."""
+        with self.condition:
+            operation = self.pending.get(filename)
+
+            if operation and operation[0] == 'append':
+                operation[1].extend(data)
+            else:
+                self.pending[filename] = ('append', bytearray(data))
+
+            self.condition.notify_all()
+
+    def remove(self, filename):
+        """Remove the given file, if it exists."""
+        with self.condition:
+            self.pending[filename] = ('remove',)
+            self.condition.notify_all()
+
+    def flush(self):
+        """Wait for every requested operation to be processed."""
+        with self.condition:
+            self.condition.wait_for(lambda: not self.pending and not self.is_busy)
+
+    def close(self):
+        """Process every requested operation, then stop the background thread."""
+        with self.condition:
+            self.is_closing = True
+            self.condition.notify_all()
+
+        self.thread.join()
+
+    def _run(self):
+        """The background thread main loop."""
+        while True:
+            with self.condition:
+                self.is_busy = False
+                self.condition.notify_all()
+
+                self.condition.wait_for(lambda: self.pending or self.is_closing)
+
+                if not self.pending: # Closing and nothing left to do
+                    return
+
+                filename = next(iter(self.pending))
+                operation = self.pending.pop(filename)
+
+                self.is_busy = True
+
+            try:
+                if operation[0] == 'write':
+                    write_atomically(filename, operation[1](operation[2]))
+                elif operation[0] == 'append':
+                    with open(filename, 'ab') as f:
+                        f.write(operation[1])
+                elif operation[0] == 'remove' and os.path.isfile(filename):
+                    os.remove(filename)
+            except Exception:
+                logging.exception('Unable to write ' + filename)
@@ -1,6 +1,4 @@
-import settings
-import pygame
-
+from collections import namedtuple
 
 __all__ = [
     'ITetrimino',
@@ -13,203 +11,146 @@ __all__ = [
 ]
 
 
-class Block(pygame.sprite.Sprite):
-    def __init__(self, background_color, x, y):
-        super(Block, self).__init__()
+Rotation = namedtuple('Rotation', ['cells', 'width', 'height', 'bottoms'])
 
+
+class Block:
+    def __init__(self, background_color, x, y):
         self.background_color = background_color
         self.x = x
         self.y = y
 
-        self._draw()
+    def will_collide(self, playground, direction=(0, 0)):
+        """Check if this block is about to collide with other blocks or the playground bounds in the specified direction."""
+        return playground.is_occupied(self.x + direction[0], self.y + direction[1])
 
-    def __getstate__(self):
-        """Needed by Pickle to give the proper attributes to be picked."""
-        state = self.__dict__.copy()
 
-        del state['image']
-        del state['rect']
+class Tetrimino:
+    def __init__(self, x, y, rotation=0):
+        self.x = x
+        self.y = y
+        self.rotation = rotation
 
-        return state
+        self.blocks = [Block(self.background_color, x + cell_x, y + cell_y) for cell_x, cell_y in self.rotations[rotation].cells]
 
     def __setstate__(self, state):
-        """Needed by Pickle to properly initialize this Block instance."""
+        """Needed by Pickle to properly initialize Tetriminos saved before the rotation states were introduced."""
         self.__dict__.update(state)
 
-        self._draw()
+        if 'rotation' in state:
+            return
 
-    def _draw(self):
-        """Draw this Block object."""
-        self.image = pygame.Surface((settings.BLOCKS_SIDE_SIZE, settings.BLOCKS_SIDE_SIZE), pygame.SRCALPHA, 32).convert_alpha()
-        self.image.fill(self.background_color)
+        self.__dict__.pop('pattern', None)
 
-        self.rect = self.image.get_rect()
+        self.x = min(block.x for block in self.blocks)
+        self.y = min(block.y for block in self.blocks)
 
-    def will_collide(self, fallen_blocks, direction=(0, 0)):
-        """Check if this block is about to collide with other blocks in the specified direction."""
-        new_x = self.x + direction[0]
-        new_y = self.y + direction[1]
+        offsets = sorted((block.x - self.x, block.y - self.y) for block in self.blocks)
 
-        for fallen_block in fallen_blocks:
-            if fallen_block.x == new_x and fallen_block.y == new_y:
-                return True
+        for rotation, state in enumerate(self.rotations):
+            if sorted(state.cells) == offsets:
+                self.rotation = rotation
 
-        return False
-
-    def is_bottommost(self):
-        """Check if this block is on the bottommost of the playground."""
-        if self.y == settings.ROWS - 1:
-            return True
-
-        return False
-
-    def is_leftmost(self):
-        """Check if this block is on the leftmost of the playground."""
-        if self.x == 0:
-            return True
-
-        return False
+                break
 
-    def is_rightmost(self):
-        """Check if this block is on the rightmost of the playground."""
-        if self.x == settings.COLS - 1:
-            return True
-
-        return False
-
-
-class Tetrimino:
-    def __init__(self, x, y):
-        self._draw(x, y)
-
-    def _draw(self, x, y):
-        """Draw the blocks of this Tetrimino."""
-        self.blocks = []
-
-        for pat_y, y_val in enumerate(self.pattern):
-            for pat_x, x_val in enumerate(self.pattern[pat_y]):
-                if self.pattern[pat_y][pat_x] != 1:
-                    continue
-
-                self.blocks.append(Block(self.background_color, x + pat_x, y + pat_y))
-
-    def make_it_fall(self, fallen_blocks):
+    def make_it_fall(self, playground):
         """Makes this Tetrimino to fall."""
-        if self.is_bottommost() or self.will_collide(fallen_blocks, (0, 1)):
+        if self.will_collide(playground, (0, 1)):
             return False
 
+        self.y += 1
+
         for block in self.blocks:
             block.y += 1
 
         return True
 
-    def move_left(self, fallen_blocks):
+    def move_left(self, playground):
         """Moves this Tetrimino to the left."""
-        if self.is_leftmost() or self.will_collide(fallen_blocks, (-1, 0)):
+        if self.will_collide(playground, (-1, 0)):
             return False
 
+        self.x -= 1
+
         for block in self.blocks:
             block.x -= 1
 
         return True
 
-    def move_right(self, fallen_blocks):
+    def move_right(self, playground):
         """Moves this Tetrimino to the right."""
-        if self.is_rightmost() or self.will_collide(fallen_blocks, (1, 0)):
+        if self.will_collide(playground, (1, 0)):
             return False
 
+        self.x += 1
+
         for block in self.blocks:
             block.x += 1
 
         return True
 
-    def get_top_left_pos(self):
-        """Return the position of the top-left-most block of this Tetrimino."""
-        left_most_x = settings.COLS - 1
-        top_most_y = settings.ROWS - 1
-
-        for block in self.blocks:
-            if block.x < left_most_x:
-                left_most_x = block.x
-
-            if block.y < top_most_y:
-                top_most_y = block.y
-
-        return left_most_x, top_most_y
-
-    def rotate(self, fallen_blocks):
+    def rotate(self, playground):
         """Rotates this Tetrimino by 90 degrees clockwise."""
-        left_most_block_x, top_most_block_y = self.get_top_left_pos()
-
-        # Rotate the pattern of this Tetrimino by 90 degress clockwise
-        new_pattern = list(zip(*self.pattern[::-1]))
+        rotation = (self.rotation + 1) % len(self.rotations)
+        cells, width, height, bottoms = self.rotations[rotation]
 
-        new_pattern_height = len(new_pattern)
-        new_pattern_width = len(new_pattern[0])
+        # Keep the rotated Tetrimino inside the playground
+        x = min(self.x, playground.cols - width)
+        y = min(self.y, playground.rows - height)
 
-        # Check if the new position of all the blocks will collide with others or will go outside the playground
-        for pat_y, y_val in enumerate(new_pattern):
-            for pat_x, x_val in enumerate(new_pattern[pat_y]):
-                if new_pattern[pat_y][pat_x] != 1:
-                    continue
+        # Check if the new position of all the blocks will collide with already fallen ones. If yes, abort the rotating operation
+        for cell_x, cell_y in cells:
+            if playground.is_occupied(x + cell_x, y + cell_y):
+                return False
 
-                new_x = left_most_block_x + pat_x
-                new_y = top_most_block_y + pat_y
-
-                if new_x < 0:
-                    left_most_block_x = 0
+        self.rotation = rotation
+        self.x = x
+        self.y = y
 
-                if new_x > settings.COLS - 1:
-                    left_most_block_x = (settings.COLS - 1) - (new_pattern_width - 1)
+        for block, (cell_x, cell_y) in zip(self.blocks, cells):
+            block.x = x + cell_x
+            block.y = y + cell_y
 
-                if new_y < 0:
-                    top_most_block_y = 0
+        return True
 
-                if new_y > settings.ROWS - 1:
-                    top_most_block_y = (settings.ROWS - 1) - (new_pattern_height - 1)
+    def drop(self, playground):
+        """Makes this Tetrimino to fall as far as it can at once."""
+        y = self.get_landing_y(playground)
 
-                new_x = left_most_block_x + pat_x
-                new_y = top_most_block_y + pat_y
+        if y == self.y:
+            return False
 
-                # Check if the new block is colliding with an already fallen one. If yes, abort the rotating operation
-                for fallen_block in fallen_blocks:
-                    if fallen_block.x == new_x and fallen_block.y == new_y:
-                        return False
+        for block in self.blocks:
+            block.y += y - self.y
 
-        # If there'll not be any issue while rotating this Tetrimino: erase the old pattern as well as the old blocks
-        self.pattern = new_pattern
-        self._draw(left_most_block_x, top_most_block_y)
+        self.y = y
 
         return True
 
-    def will_collide(self, fallen_blocks, direction=(0, 0)):
-        """Check if this Tetrimino is about to collide with other blocks in the specified direction."""
-        for block in self.blocks:
-            if block.will_collide(fallen_blocks, direction):
-                return True
+    def get_landing_y(self, playground):
+        """Return the row this Tetrimino would land at if it was falling straight down.
 
-        return False
+        Found from the heights profile of the playground, so it only depends on
+        the width of the Tetrimino, unless there's a block above it (it was
+        moved below an overhang): it's then made to fall row by row."""
+        tops = playground.tops
+        y = min(tops[self.x + col] - 1 - bottom for col, bottom in enumerate(self.rotations[self.rotation].bottoms))
 
-    def is_bottommost(self):
-        """Check if this Tetrimino is on the bottommost of the playground."""
-        for block in self.blocks:
-            if block.is_bottommost():
-                return True
+        if y >= self.y:
+            return y
 
-        return False
+        cells = self.rotations[self.rotation].cells
+        y = self.y
 
-    def is_leftmost(self):
-        """Check if this Tetrimino is on the leftmost of the playground."""
-        for block in self.blocks:
-            if block.is_leftmost():
-                return True
+        while not any(playground.is_occupied(self.x + cell_x, y + 1 + cell_y) for cell_x, cell_y in cells):
+            y += 1
 
-        return False
+        return y
 
-    def is_rightmost(self):
-        """Check if this Tetrimino is on the rightmost of the playground."""
+    def will_collide(self, playground, direction=(0, 0)):
+        """Check if this Tetrimino is about to collide with other blocks or the playground bounds in the specified direction."""
         for block in self.blocks:
-            if block.is_rightmost():
+            if block.will_collide(playground, direction):
                 return True
 
         return False
@@ -275,3 +216,30 @@ class ZTetrimino(Tetrimino):
         [1, 1],
         [1, 0]
     ]
+
+
+def _get_rotations(pattern):
+    """Compute the rotation states of a pattern, each one being rotated by 90 degrees clockwise from the previous one.
+
+    Cells are the (x, y) positions of the blocks relative to the top-left
+    corner of the Tetrimino, bottoms the y position of the lowest block of each
+    of its columns."""
+    rotations = []
+
+    for i in range(0, 4):
+        cells = tuple((pat_x, pat_y) for pat_y, y_val in enumerate(pattern) for pat_x, x_val in enumerate(y_val) if x_val == 1)
+
+        rotations.append(Rotation(
+            cells,
+            len(pattern[0]),
+            len(pattern),
+            tuple(max(cell_y for cell_x, cell_y in cells if cell_x == x) for x in range(0, len(pattern[0])))
+        ))
+
+        pattern = list(zip(*pattern[::-1]))
+
+    return tuple(rotations)
+
+
+for name in __all__:
+    globals()[name].rotations = _get_rotations(globals()[name].pattern)